@@ -3,30 +3,66 @@ S3配置文件，用于存储S3服务的配置参数
 
 作者：KO
 创建时间：2024-01-01
-修改时间：2026-01-27
+修改时间：2026-10-15
 
 功能：
-- 从环境变量加载S3配置参数
+- 从环境变量加载S3配置参数（每个进程只加载一次）
 - 提供默认配置值
 - 定义S3客户端配置
+- 定义文件传输配置
 """
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
 
-# 加载.env文件中的环境变量
-load_dotenv()
+@lru_cache(maxsize=1)
+def get_s3_config():
+    """
+    加载S3配置参数
 
-# S3配置参数
-S3_CONFIG = {
-    "endpoint_url": os.getenv("S3_ENDPOINT", "http://localhost:9000/"),  # S3服务端点URL
-    "bucket": os.getenv("S3_BUCKET", "test-bucket"),  # 默认存储桶名称
-    "region_name": os.getenv("S3_REGION", "us-east-1"),  # S3服务区域
-    "aws_access_key_id": os.getenv("S3_ACCESS_KEY", "minioadmin"),  # S3访问密钥
-    "aws_secret_access_key": os.getenv("S3_SECRET_KEY", "minioadmin"),  # S3密钥
-    "config": {
-        "s3": {
-            "use_accelerate_endpoint": False,  # 是否使用加速端点
-            "addressing_style": "path"  # 寻址样式，使用path模式
-        }
+    首次调用时读取.env文件和环境变量，之后的调用直接返回缓存的配置
+
+    返回值：
+    - dict: S3配置参数
+    """
+    # 加载.env文件中的环境变量
+    load_dotenv()
+
+    return {
+        "endpoint_url": os.getenv("S3_ENDPOINT", "http://localhost:9000/"),  # S3服务端点URL
+        "bucket": os.getenv("S3_BUCKET", "test-bucket"),  # 默认存储桶名称
+        "region_name": os.getenv("S3_REGION", "us-east-1"),  # S3服务区域
+        "aws_access_key_id": os.getenv("S3_ACCESS_KEY", "minioadmin"),  # S3访问密钥
+        "aws_secret_access_key": os.getenv("S3_SECRET_KEY", "minioadmin"),  # S3密钥
+        "sqs_endpoint_url": os.getenv("S3_SQS_ENDPOINT") or None,  # SQS服务端点URL，未设置时使用AWS默认端点
+        "sqs_queue_url": os.getenv("S3_SQS_QUEUE_URL") or None,  # 接收存储桶事件通知的SQS队列URL，未设置时使用轮询监听
+        "config": {
+            "s3": {
+                "use_accelerate_endpoint": False,  # 是否使用加速端点
+                "addressing_style": "path"  # 寻址样式，使用path模式
+            },
+            "max_pool_connections": int(os.getenv("S3_MAX_POOL_CONNECTIONS", "64")),  # 连接池大小，默认10不足以支撑并发请求
+            "tcp_keepalive": True,  # 启用TCP keepalive，复用长连接
+            "retries": {
+                "max_attempts": 5,  # 最大重试次数
+                "mode": "adaptive"  # 自适应重试模式
+            }
+        },
+        "transfer": {
+            "multipart_threshold": 8 * 1024 * 1024,  # 超过8MB的文件使用分片上传
+            "multipart_chunksize": 8 * 1024 * 1024,  # 分片大小8MB
+            "max_concurrency": min(16, (os.cpu_count() or 1) * 4),  # 并发上传的分片数
+            "io_chunksize": 1024 * 1024,  # 每次从文件读取1MB，减少read调用次数
+            "use_threads": True  # 使用线程并发传输分片
+        },
+        "download_transfer": {
+            "multipart_threshold": 8 * 1024 * 1024,  # 超过8MB的对象按范围分段下载
+            "multipart_chunksize": 8 * 1024 * 1024,  # 每个范围请求8MB
+            "max_concurrency": 8,  # 并发下载的分段数
+            "use_threads": True  # 使用线程并发下载分段
+        },
+        "parallel_download_threshold": 32 * 1024 * 1024  # 超过32MB的对象改用并发范围下载
     }
-}
\ No newline at end of file
+
+# S3配置参数
+S3_CONFIG = get_s3_config()
@@ -3,28 +3,62 @@ S3服务API主文件，使用FastAPI框架实现S3操作的RESTful接口
 
 作者：KO
 创建时间：2024-01-01
-修改时间：2026-01-27
+修改时间：2026-10-15
 
 功能：
 - 文件上传到S3存储桶
+- 将请求体以分片上传方式流式写入S3存储桶
 - 从S3存储桶下载文件
+- 从S3存储桶批量下载文件（tar打包）
 - 从S3存储桶删除文件
 - 检查文件是否存在于S3存储桶
+- 使用S3 Select在服务端过滤文件内容
 - 列出S3存储桶中的所有文件
 - 列出所有S3存储桶
 - 创建新的S3存储桶
 - 健康检查
 - 根路径重定向到静态文件
 """
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query
-from fastapi.responses import StreamingResponse, PlainTextResponse, RedirectResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Depends, Body, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse, RedirectResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from s3_service import S3Service
-import mimetypes
+from starlette.formparsers import MultiPartParser
+from contextlib import asynccontextmanager
+from typing import List
+from config import S3_CONFIG
+from s3_service import S3Service, get_s3_service
+import atexit
+import anyio
+import asyncio
+import io
+import tarfile
+import time
+import itertools
+import orjson
 
-# 创建FastAPI应用实例
-app = FastAPI(title="S3 Service API", description="FastAPI implementation of S3 operations")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期管理
+
+    启动时将线程池大小调整为与boto3连接池一致，使同步的S3调用可以充分并发
+    """
+    anyio.to_thread.current_default_thread_limiter().total_tokens = S3_CONFIG["config"]["max_pool_connections"]
+    yield
+
+# 上传文件在内存中缓存的最大大小，超过后写入临时文件（Starlette默认为1MB）
+# 该设置对进程内所有multipart请求生效，每个并发上传最多占用4MB内存，64个并发上传约占用256MB
+MultiPartParser.max_file_size = 4 * 1024 * 1024
+
+# 创建FastAPI应用实例，默认使用orjson序列化JSON响应
+app = FastAPI(
+    title="S3 Service API",
+    description="FastAPI implementation of S3 operations",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
 
 # 配置CORS
 app.add_middleware(
@@ -38,14 +72,118 @@ app.add_middleware(
 # 配置静态文件服务
 app.mount("/static", StaticFiles(directory="static", html=True), name="static")
 
-# 创建S3服务实例
-s3_service = S3Service()
+def _stop_listeners():
+    """
+    进程退出时停止所有存储桶监听器，S3服务实例未创建时不做任何处理
+    """
+    if get_s3_service.cache_info().currsize:
+        get_s3_service().stop_all_listeners()
+
+atexit.register(_stop_listeners)
+
+# 下载时每次从S3响应流读取的块大小
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# 流式上传的分片大小和同时上传的最大分片数
+UPLOAD_PART_SIZE = 8 * 1024 * 1024
+MAX_CONCURRENT_PARTS = 8
+
+# S3分片上传最多允许10000个分片，每上传1000个分片后分片大小增加UPLOAD_PART_SIZE，最多可上传约440GB
+MAX_UPLOAD_PARTS = 10000
+PARTS_PER_SIZE_STEP = 1000
+
+def _part_size(part_number):
+    """
+    计算流式上传中指定分片的大小
+    
+    参数：
+    - part_number: int，分片编号，从1开始
+    
+    返回值：
+    - int: 分片大小
+    """
+    return UPLOAD_PART_SIZE * (1 + (part_number - 1) // PARTS_PER_SIZE_STEP)
+
+def _object_size(response):
+    """
+    获取S3对象的总大小，范围请求的响应从ContentRange中读取
+    
+    参数：
+    - response: dict，get_object响应
+    
+    返回值：
+    - int: 对象总大小
+    """
+    content_range = response.get("ContentRange")
+    if content_range:
+        # 格式为bytes 0-99/1000
+        return int(content_range.rsplit("/", 1)[1])
+    return response["ContentLength"]
+
+def _tar_member_name(key):
+    """
+    将S3对象键转换为安全的tar成员名称，去除开头的/以及.和..路径段，防止解压时路径穿越
+    
+    参数：
+    - key: str，S3对象键
+    
+    返回值：
+    - str: tar成员名称
+    """
+    parts = [part for part in key.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+    return "/".join(parts) or "_"
+
+def _iter_tar(items):
+    """
+    将文件内容流式打包为tar格式
+    
+    中途下载失败时响应已经开始发送，只能中断输出；此时tar流缺少结束标记，解压工具会报告文件不完整
+    
+    参数：
+    - items: Iterator[Tuple[str, bytes]]，(对象键, 文件内容)
+    
+    返回值：
+    - Iterator[bytes]: tar数据块
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(mode="w|", fileobj=buffer) as tar:
+        for key, data in items:
+            info = tarfile.TarInfo(name=_tar_member_name(key))
+            info.size = len(data)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(data))
+            # 输出已写入缓冲区的数据并清空缓冲区
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def _iter_json_array(items, batch_size=1000):
+    """
+    将对象逐批序列化为JSON数组，避免一次性在内存中构建完整列表
+    
+    参数：
+    - items: Iterator[dict]，要序列化的对象
+    - batch_size: int，可选，每批序列化的对象数量，默认为1000
+    
+    返回值：
+    - Iterator[bytes]: JSON数组数据块
+    """
+    yield b"["
+    separator = b""
+    while batch := list(itertools.islice(items, batch_size)):
+        yield separator + b",".join(orjson.dumps(item) for item in batch)
+        separator = b","
+    yield b"]"
+
+# 调用boto3同步接口的端点声明为普通函数，由FastAPI放入线程池执行，避免阻塞事件循环
 
 @app.post("/api/s3/upload")
-async def upload_file(
+def upload_file(
     file: UploadFile = File(...),
     key: str = Query(None, description="Optional S3 object key, if not provided, use original filename"),
-    bucket: str = Query(None, description="Optional bucket name, if not provided, use default bucket")
+    bucket: str = Query(None, description="Optional bucket name, if not provided, use default bucket"),
+    service: S3Service = Depends(get_s3_service)
 ):
     """
     上传文件到S3存储桶
@@ -54,6 +192,7 @@ async def upload_file(
     - file: UploadFile对象，要上传的文件
     - key: str，可选，S3对象键，默认为原始文件名
     - bucket: str，可选，存储桶名称，默认为默认存储桶
+    - service: S3Service，依赖注入的S3服务实例
     
     返回值：
     - dict: 包含上传成功消息和对象键的响应
@@ -64,15 +203,98 @@ async def upload_file(
     try:
         # 如果没有提供key，使用原始文件名
         object_key = key or file.filename
-        s3_service.upload_file(file, object_key, bucket)
+        service.upload_file(file, object_key, bucket)
         return {"message": f"File uploaded successfully with key: {object_key}"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/s3/upload-stream")
+async def upload_stream(
+    request: Request,
+    key: str = Query(..., description="S3 object key"),
+    bucket: str = Query(None, description="Optional bucket name, if not provided, use default bucket"),
+    service: S3Service = Depends(get_s3_service)
+):
+    """
+    将请求体直接以分片上传方式写入S3存储桶，不在本地缓存整个文件
+    
+    参数：
+    - request: Request，请求体为文件内容
+    - key: str，S3对象键
+    - bucket: str，可选，存储桶名称，默认为默认存储桶
+    - service: S3Service，依赖注入的S3服务实例
+    
+    返回值：
+    - dict: 包含上传成功消息和对象键的响应
+    
+    异常：
+    - HTTPException: 上传失败时抛出，状态码500
+    """
+    buffer = bytearray()
+    upload_id = None
+    parts = []
+    tasks = []
+    errors = []
+    # 限制同时上传的分片数，已上传完成的分片释放名额后才继续读取请求体
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_PARTS)
+    
+    async def upload_part(part_number, data):
+        try:
+            parts.append(await run_in_threadpool(service.upload_part, key, upload_id, part_number, data, bucket))
+        except Exception as e:
+            errors.append(e)
+            raise
+        finally:
+            semaphore.release()
+    
+    async def submit_part(data):
+        if len(tasks) >= MAX_UPLOAD_PARTS:
+            raise Exception(f"Upload exceeds the maximum of {MAX_UPLOAD_PARTS} parts")
+        await semaphore.acquire()
+        # 已有分片上传失败时不再继续读取和上传请求体
+        if errors:
+            semaphore.release()
+            raise errors[0]
+        tasks.append(asyncio.create_task(upload_part(len(tasks) + 1, data)))
+    
+    try:
+        async for chunk in request.stream():
+            if errors:
+                raise errors[0]
+            buffer += chunk
+            while len(buffer) >= (part_size := _part_size(len(tasks) + 1)):
+                if upload_id is None:
+                    upload_id = await run_in_threadpool(service.start_multipart_upload, key, bucket)
+                await submit_part(bytes(buffer[:part_size]))
+                del buffer[:part_size]
+        
+        if upload_id is None:
+            # 请求体不足一个分片时直接上传
+            await run_in_threadpool(service.upload_bytes, key, bytes(buffer), bucket)
+        else:
+            if buffer:
+                await submit_part(bytes(buffer))
+            await asyncio.gather(*tasks)
+            await run_in_threadpool(service.complete_multipart_upload, key, upload_id, parts, bucket)
+        return {"message": f"File uploaded successfully with key: {key}"}
+    except Exception as e:
+        if upload_id is not None:
+            # 等待进行中的分片结束后取消上传任务，避免残留未完成的分片
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            try:
+                await run_in_threadpool(service.abort_multipart_upload, key, upload_id, bucket)
+            except Exception as abort_error:
+                # 取消失败时已上传的分片会残留在存储桶中，记录上传ID以便后续清理
+                print(f"Failed to abort multipart upload {upload_id} for key {key}: {abort_error}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/s3/download/{key}")
-async def download_file(
+def download_file(
     key: str,
-    bucket: str = Query(None, description="Optional bucket name, if not provided, use default bucket")
+    bucket: str = Query(None, description="Optional bucket name, if not provided, use default bucket"),
+    service: S3Service = Depends(get_s3_service)
 ):
     """
     从S3存储桶下载文件
@@ -80,6 +302,7 @@ async def download_file(
     参数：
     - key: str，S3对象键
     - bucket: str，可选，存储桶名称，默认为默认存储桶
+    - service: S3Service，依赖注入的S3服务实例
     
     返回值：
     - StreamingResponse: 包含文件内容的流式响应
@@ -88,25 +311,75 @@ async def download_file(
     - HTTPException: 下载失败时抛出，状态码500
     """
     try:
-        response = s3_service.download_file(key, bucket)
+        # 只请求前threshold字节：小文件一次GET即可取得全部内容，大文件从ContentRange得到总大小
+        threshold = S3_CONFIG["parallel_download_threshold"]
+        response = service.download_file(key, bucket, f"bytes=0-{threshold - 1}")
         content_type = response.get("ContentType", "application/octet-stream")
+        size = _object_size(response)
+        # 按大块读取以减少线程池切换次数（StreamingBody默认按1KB迭代）
+        content = response["Body"].iter_chunks(DOWNLOAD_CHUNK_SIZE)
+        
+        if size > threshold:
+            # 大文件剩余部分使用并发范围请求，并通过ETag确保与已下载部分属于同一版本
+            metadata = {"ContentLength": size, "ETag": response["ETag"]}
+            content = itertools.chain(content, service.download_file_parallel(key, bucket, metadata, threshold))
         
         # 返回流式响应
         return StreamingResponse(
-            response["Body"],
+            content,
             media_type=content_type,
             headers={
                 "Content-Disposition": f"attachment; filename={key}",
-                "Content-Length": str(response["ContentLength"])
+                "Content-Length": str(size)
             }
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/s3/download-batch")
+def download_batch(
+    keys: List[str] = Body(..., description="List of S3 object keys to download"),
+    bucket: str = Query(None, description="Optional bucket name, if not provided, use default bucket"),
+    service: S3Service = Depends(get_s3_service)
+):
+    """
+    从S3存储桶批量下载文件，打包为tar流返回
+    
+    参数：
+    - keys: List[str]，S3对象键列表
+    - bucket: str，可选，存储桶名称，默认为默认存储桶
+    - service: S3Service，依赖注入的S3服务实例
+    
+    返回值：
+    - StreamingResponse: 包含所有文件的tar流式响应，开始发送后再发生的下载失败会使tar流被截断
+    
+    异常：
+    - HTTPException: 未提供对象键时抛出，状态码400
+    - HTTPException: 第一个文件下载失败时抛出，状态码500
+    """
+    if not keys:
+        raise HTTPException(status_code=400, detail="At least one key is required")
+    
+    # 文件并发下载，按完成顺序写入tar流
+    files = service.get_many(keys, bucket)
+    try:
+        # 预先取得第一个文件，使存储桶不存在、无权限等错误在响应开始前返回
+        first = next(files)
+    except Exception as e:
+        files.close()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return StreamingResponse(
+        _iter_tar(itertools.chain([first], files)),
+        media_type="application/x-tar",
+        headers={"Content-Disposition": "attachment; filename=download.tar"}
+    )
+
 @app.delete("/api/s3/delete/{key}")
-async def delete_file(
+def delete_file(
     key: str,
-    bucket: str = Query(None, description="Optional bucket name, if not provided, use default bucket")
+    bucket: str = Query(None, description="Optional bucket name, if not provided, use default bucket"),
+    service: S3Service = Depends(get_s3_service)
 ):
     """
     从S3存储桶删除文件
@@ -114,6 +387,7 @@ async def delete_file(
     参数：
     - key: str，S3对象键
     - bucket: str，可选，存储桶名称，默认为默认存储桶
+    - service: S3Service，依赖注入的S3服务实例
     
     返回值：
     - dict: 包含删除成功消息的响应
@@ -122,15 +396,16 @@ async def delete_file(
     - HTTPException: 删除失败时抛出，状态码500
     """
     try:
-        s3_service.delete_file(key, bucket)
+        service.delete_file(key, bucket)
         return {"message": f"File deleted successfully: {key}"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/s3/exists/{key}")
-async def check_file_exists(
+def check_file_exists(
     key: str,
-    bucket: str = Query(None, description="Optional bucket name, if not provided, use default bucket")
+    bucket: str = Query(None, description="Optional bucket name, if not provided, use default bucket"),
+    service: S3Service = Depends(get_s3_service)
 ):
     """
     检查文件是否存在于S3存储桶
@@ -138,6 +413,7 @@ async def check_file_exists(
     参数：
     - key: str，S3对象键
     - bucket: str，可选，存储桶名称，默认为默认存储桶
+    - service: S3Service，依赖注入的S3服务实例
     
     返回值：
     - bool: 文件是否存在
@@ -146,11 +422,45 @@ async def check_file_exists(
     - HTTPException: 检查失败时抛出，状态码500
     """
     try:
-        exists = s3_service.file_exists(key, bucket)
+        exists = service.file_exists(key, bucket)
         return exists
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/s3/select")
+def select_file_content(
+    key: str = Query(..., description="S3 object key"),
+    expression: str = Body(..., embed=True, description="SQL expression, e.g. SELECT * FROM S3Object s"),
+    inputFormat: str = Body("JSON", embed=True, description="Object format: CSV, JSON, JSONL or Parquet"),
+    bucket: str = Query(None, description="Optional bucket name, if not provided, use default bucket"),
+    service: S3Service = Depends(get_s3_service)
+):
+    """
+    使用S3 Select在服务端过滤文件内容，只返回匹配的记录
+    
+    参数：
+    - key: str，S3对象键
+    - expression: str，SQL查询表达式
+    - inputFormat: str，可选，对象格式，默认为JSON
+    - bucket: str，可选，存储桶名称，默认为默认存储桶
+    - service: S3Service，依赖注入的S3服务实例
+    
+    返回值：
+    - StreamingResponse: 以换行分隔的JSON记录流式响应
+    
+    异常：
+    - HTTPException: 输入格式不支持时抛出，状态码400
+    - HTTPException: 查询失败时抛出，状态码500
+    """
+    try:
+        records = service.select(key, expression, inputFormat, bucket)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return StreamingResponse(records, media_type="application/x-ndjson")
+
 @app.get("/api/s3/health")
 async def health_check():
     """
@@ -162,53 +472,67 @@ async def health_check():
     return PlainTextResponse("S3 Service is running")
 
 @app.get("/api/s3/list")
-async def list_files(
-    bucket: str = Query(None, description="Optional bucket name, if not provided, use default bucket")
+def list_files(
+    bucket: str = Query(None, description="Optional bucket name, if not provided, use default bucket"),
+    service: S3Service = Depends(get_s3_service)
 ):
     """
     列出S3存储桶中的所有文件
     
     参数：
     - bucket: str，可选，存储桶名称，默认为默认存储桶
+    - service: S3Service，依赖注入的S3服务实例
     
     返回值：
-    - list: 文件列表，每个文件包含key、size和lastModified属性
+    - StreamingResponse: 以JSON数组流式返回的文件列表，每个文件包含key、size和lastModified属性
     
     异常：
     - HTTPException: 列出失败时抛出，状态码500
     """
     try:
-        files = s3_service.list_files(bucket)
-        return files
+        files = service.iter_files(bucket)
+        # 预先读取第一个文件，使存储桶不存在等错误在响应开始前返回
+        first = next(files, None)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    items = files if first is None else itertools.chain([first], files)
+    return StreamingResponse(_iter_json_array(items), media_type="application/json")
 
 @app.get("/api/s3/buckets")
-async def list_buckets():
+def list_buckets(
+    service: S3Service = Depends(get_s3_service)
+):
     """
     列出所有S3存储桶
     
+    参数：
+    - service: S3Service，依赖注入的S3服务实例
+    
     返回值：
-    - list: 存储桶列表，每个存储桶包含name和creationDate属性
+    - ORJSONResponse: 存储桶列表，每个存储桶包含name和creationDate属性
     
     异常：
     - HTTPException: 列出失败时抛出，状态码500
     """
     try:
-        buckets = s3_service.list_buckets()
-        return buckets
+        buckets = service.list_buckets()
+        # 直接返回响应对象，跳过FastAPI对返回值的jsonable_encoder遍历，由orjson直接序列化datetime
+        return ORJSONResponse(buckets)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/s3/bucket")
-async def create_bucket(
-    bucketName: str = Query(..., description="Name of the bucket to create")
+def create_bucket(
+    bucketName: str = Query(..., description="Name of the bucket to create"),
+    service: S3Service = Depends(get_s3_service)
 ):
     """
     创建新的S3存储桶
     
     参数：
     - bucketName: str，要创建的存储桶名称
+    - service: S3Service，依赖注入的S3服务实例
     
     返回值：
     - dict: 包含创建成功消息的响应
@@ -218,7 +542,7 @@ async def create_bucket(
     - HTTPException: 创建失败时抛出，状态码500
     """
     try:
-        created = s3_service.create_bucket(bucketName)
+        created = service.create_bucket(bucketName)
         if created:
             return {"message": f"Bucket created successfully: {bucketName}"}
         else:
@@ -3,26 +3,48 @@ S3服务类，提供S3存储操作的核心功能
 
 作者：KO
 创建时间：2024-01-01
-修改时间：2026-01-30
+修改时间：2026-10-15
 
 功能：
-- 文件上传到S3存储桶
+- 文件上传到S3存储桶（支持分片流式上传）
 - 从S3存储桶下载文件
+- 从S3存储桶并发批量下载文件
 - 从S3存储桶删除文件
 - 检查文件是否存在于S3存储桶
+- 使用S3 Select在服务端过滤文件内容
 - 列出S3存储桶中的所有文件
 - 列出所有S3存储桶
 - 创建新的S3存储桶
 - 检查存储桶是否存在
-- 监听S3存储桶变化事件
+- 监听S3存储桶变化事件（轮询或SQS事件通知）
+- 提供进程内唯一的S3服务实例
 """
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from cachetools import TTLCache
 from config import S3_CONFIG
-import time
+import itertools
+import json
+import mimetypes
 import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from datetime import datetime
 from enum import Enum
-from typing import Dict, List, Optional, Callable, Any
+from functools import lru_cache
+from urllib.parse import unquote_plus
+from typing import Dict, List, Optional, Callable, Any, Iterator, Tuple
+
+__all__ = [
+    "S3Service",
+    "BucketListener",
+    "BucketListenerConfig",
+    "S3Event",
+    "EventType",
+    "get_s3_service",
+]
 
 # 事件类型枚举
 class EventType(Enum):
@@ -52,21 +74,31 @@ class BucketListenerConfig:
         self.event_handler: Optional[Callable[[S3Event], None]] = None
         self.max_retries: int = 3  # 默认3次
         self.retry_interval: int = 2  # 默认2秒
+        # 设置后通过SQS接收事件通知，不再轮询列举对象；队列必须专用于被监听的存储桶，
+        # 其他存储桶的消息和格式不正确的消息会被直接删除，不会触发事件
+        self.sqs_queue_url: Optional[str] = None
+        self.sqs_wait_time: int = 4  # SQS长轮询等待时间，默认4秒，不超过停止监听器时等待线程结束的时间
 
 # 存储桶监听器类
 class BucketListener:
+    # 停止监听器时等待线程结束的最长时间（秒）
+    STOP_TIMEOUT = 5
+
     def __init__(self, service, config: BucketListenerConfig):
         self.service = service
         self.config = config
         self.running = False
         self.thread = None
         self.last_objects: Dict[str, Dict[str, Any]] = {}
+        # 停止信号，等待期间可被立即唤醒
+        self._stop_event = threading.Event()
 
     def start(self):
         if self.running:
             return
 
         self.running = True
+        self._stop_event.clear()
         bucket = self.config.bucket or self.service.default_bucket
 
         # 初始化对象列表
@@ -93,20 +125,23 @@ class BucketListener:
             return
 
         self.running = False
+        self._stop_event.set()
         if self.thread:
-            self.thread.join(timeout=5)
+            self.thread.join(timeout=self.STOP_TIMEOUT)
         print("S3 Bucket listener stopped")
 
     def _run(self, bucket: str):
-        while self.running:
+        # 配置了SQS队列时通过事件通知获取变化，列举对象仅用于启动时初始化
+        check = self._receive_events if self.config.sqs_queue_url else self._check_for_changes
+        while not self._stop_event.is_set():
             try:
-                self._check_for_changes(bucket)
+                check(bucket)
             except Exception as e:
                 retries = 0
-                while retries < self.config.max_retries and self.running:
+                while retries < self.config.max_retries and not self._stop_event.is_set():
                     try:
-                        time.sleep(self.config.retry_interval)
-                        self._check_for_changes(bucket)
+                        self._stop_event.wait(self.config.retry_interval)
+                        check(bucket)
                         break
                     except Exception as ex:
                         retries += 1
@@ -116,63 +151,129 @@ class BucketListener:
                             else:
                                 print(f"S3 listener error: {ex}")
             
-            # 等待下一次轮询
-            for _ in range(self.config.poll_interval):
-                if not self.running:
-                    break
-                time.sleep(1)
+            # SQS长轮询本身会等待，无需额外休眠
+            if self.config.sqs_queue_url:
+                continue
+
+            # 等待下一次轮询，收到停止信号时立即返回
+            self._stop_event.wait(self.config.poll_interval)
+
+    def _receive_events(self, bucket: str):
+        sqs_client = self.service.sqs_client
+        response = sqs_client.receive_message(
+            QueueUrl=self.config.sqs_queue_url,
+            # 长轮询等待时间不超过停止时的等待时间，保证stop()能等到线程结束
+            WaitTimeSeconds=min(self.config.sqs_wait_time, self.STOP_TIMEOUT - 1),
+            MaxNumberOfMessages=10
+        )
+        processed = []
+        try:
+            for message in response.get('Messages', []):
+                for record in self._message_records(message):
+                    event = self._parse_record(record, bucket)
+                    if event and self.config.event_handler:
+                        self.config.event_handler(event)
+                # 队列专用于当前存储桶，其他存储桶和无法解析的消息不会有其他监听器处理，同样删除，避免被反复投递
+                processed.append(message)
+        finally:
+            # 只删除已处理完成的消息，事件处理函数出错时剩余的消息稍后会被重新投递
+            if processed:
+                sqs_client.delete_message_batch(
+                    QueueUrl=self.config.sqs_queue_url,
+                    Entries=[
+                        {'Id': str(i), 'ReceiptHandle': message['ReceiptHandle']}
+                        for i, message in enumerate(processed)
+                    ]
+                )
+
+    def _message_records(self, message: Dict[str, Any]) -> List[Any]:
+        # 测试事件等消息不包含Records，无法解析的消息视为没有记录
+        try:
+            body = json.loads(message['Body'])
+        except (KeyError, ValueError):
+            return []
+        records = body.get('Records', []) if isinstance(body, dict) else []
+        return records if isinstance(records, list) else []
+
+    def _parse_record(self, record: Any, bucket: str) -> Optional[S3Event]:
+        # 其他存储桶和格式不正确的记录直接跳过，不修改对象列表
+        try:
+            if record['s3']['bucket']['name'] != bucket:
+                return None
+            event_name = record['eventName']
+            obj = record['s3']['object']
+            # 事件通知中的对象键经过URL编码
+            key = unquote_plus(obj['key'])
+            size = obj.get('size', 0)
+            e_tag = obj.get('eTag', '')
+            # 事件时间转换为与列举对象的LastModified相同的带时区datetime，便于轮询时比较
+            last_modified = datetime.fromisoformat(record['eventTime'].replace('Z', '+00:00'))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return None
+
+        if event_name.startswith('ObjectCreated:'):
+            event_type = EventType.OBJECT_CREATED
+        elif event_name.startswith('ObjectRemoved:'):
+            event_type = EventType.OBJECT_DELETED
+        else:
+            return None
+
+        # 已知对象再次写入时视为修改
+        if event_type == EventType.OBJECT_CREATED and key in self.last_objects:
+            event_type = EventType.OBJECT_MODIFIED
+        if event_type == EventType.OBJECT_DELETED:
+            self.last_objects.pop(key, None)
+        else:
+            self.last_objects[key] = {'Key': key, 'Size': size, 'LastModified': last_modified, 'ETag': e_tag}
+
+        return S3Event(
+            event_type=event_type,
+            bucket=bucket,
+            key=key,
+            size=size,
+            last_modified=last_modified,
+            e_tag=e_tag
+        )
 
     def _check_for_changes(self, bucket: str):
-        current_objects = self.service._list_objects(bucket)
-        current_map = {obj['Key']: obj for obj in current_objects}
+        current_keys = set()
+        last_objects = self.last_objects
+        handler = self.config.event_handler
+
+        # 逐页遍历列举结果，不保存完整的对象列表，检查创建和修改的对象并原地更新对象列表
+        try:
+            for obj in self.service._iter_objects(bucket):
+                key = obj['Key']
+                current_keys.add(key)
+                old_obj = last_objects.get(key)
+                if old_obj is None:
+                    if handler:
+                        self._emit(EventType.OBJECT_CREATED, bucket, key, obj)
+                elif obj['ETag'] != old_obj['ETag'] or obj['LastModified'] > old_obj['LastModified']:
+                    if handler:
+                        self._emit(EventType.OBJECT_MODIFIED, bucket, key, obj)
+                last_objects[key] = obj
+        except ClientError as e:
+            # 列举中途失败时不检查删除，避免未列举到的对象被误判为已删除
+            raise Exception(f"Failed to list objects: {e}")
 
         # 检查删除的对象
-        for key, old_obj in list(self.last_objects.items()):
-            if key not in current_map:
-                # 对象被删除
-                event = S3Event(
-                    event_type=EventType.OBJECT_DELETED,
-                    bucket=bucket,
-                    key=key,
-                    size=old_obj['Size'],
-                    last_modified=old_obj['LastModified'],
-                    e_tag=old_obj['ETag']
-                )
-                if self.config.event_handler:
-                    self.config.event_handler(event)
-
-        # 检查创建和修改的对象
-        for key, current_obj in current_map.items():
-            if key not in self.last_objects:
-                # 对象被创建
-                event = S3Event(
-                    event_type=EventType.OBJECT_CREATED,
-                    bucket=bucket,
-                    key=key,
-                    size=current_obj['Size'],
-                    last_modified=current_obj['LastModified'],
-                    e_tag=current_obj['ETag']
-                )
-                if self.config.event_handler:
-                    self.config.event_handler(event)
-            else:
-                # 检查对象是否被修改
-                old_obj = self.last_objects[key]
-                if current_obj['ETag'] != old_obj['ETag'] or current_obj['LastModified'] > old_obj['LastModified']:
-                    # 对象被修改
-                    event = S3Event(
-                        event_type=EventType.OBJECT_MODIFIED,
-                        bucket=bucket,
-                        key=key,
-                        size=current_obj['Size'],
-                        last_modified=current_obj['LastModified'],
-                        e_tag=current_obj['ETag']
-                    )
-                    if self.config.event_handler:
-                        self.config.event_handler(event)
+        if len(last_objects) > len(current_keys):
+            for key in [key for key in last_objects if key not in current_keys]:
+                old_obj = last_objects.pop(key)
+                if handler:
+                    self._emit(EventType.OBJECT_DELETED, bucket, key, old_obj)
 
-        # 更新对象列表
-        self.last_objects = current_map
+    def _emit(self, event_type: EventType, bucket: str, key: str, obj: Dict[str, Any]):
+        event = S3Event(
+            event_type=event_type,
+            bucket=bucket,
+            key=key,
+            size=obj['Size'],
+            last_modified=obj['LastModified'],
+            e_tag=obj['ETag']
+        )
+        self.config.event_handler(event)
 
 class S3Service:
     """
@@ -181,6 +282,9 @@ class S3Service:
     属性：
     - s3_client: boto3 S3客户端实例
     - default_bucket: 默认存储桶名称
+    - transfer_config: 文件上传使用的传输配置（分片大小、并发数）
+    - download_transfer_config: 大文件并发下载使用的传输配置
+    - sqs_client: boto3 SQS客户端实例，首次使用时创建
     """
     def __init__(self):
         """
@@ -195,12 +299,44 @@ class S3Service:
             region_name=S3_CONFIG["region_name"],
             aws_access_key_id=S3_CONFIG["aws_access_key_id"],
             aws_secret_access_key=S3_CONFIG["aws_secret_access_key"],
-            config=boto3.session.Config(**S3_CONFIG["config"])
+            config=Config(**S3_CONFIG["config"])
         )
         self.default_bucket = S3_CONFIG["bucket"]
+        # 大文件按分片并发上传
+        self.transfer_config = TransferConfig(**S3_CONFIG["transfer"])
+        # 大文件按范围并发下载
+        self.download_transfer_config = TransferConfig(**S3_CONFIG["download_transfer"])
+        # 所有请求共用的下载线程池，线程数与连接池大小一致，并发请求再多也不会超出连接池
+        self._transfer_executor = ThreadPoolExecutor(max_workers=S3_CONFIG["config"]["max_pool_connections"])
+        self._sqs_client = None
+        # 短期缓存存在性检查结果，减少重复的HEAD请求（TTLCache非线程安全，需加锁访问）
+        self._exists_cache = TTLCache(maxsize=10000, ttl=2)
+        self._bucket_exists_cache = TTLCache(maxsize=1000, ttl=30)
+        self._cache_lock = threading.Lock()
         self.listeners = []
-        self.event_history = []
+        # 保护监听器列表，避免并发启动和停止监听器时产生竞争
+        self._listeners_lock = threading.RLock()
         self.MAX_EVENT_HISTORY = 100
+        # 超出最大长度时自动丢弃最旧的事件
+        self.event_history = deque(maxlen=self.MAX_EVENT_HISTORY)
+    
+    @property
+    def sqs_client(self):
+        """
+        获取SQS客户端，仅在使用事件通知监听时创建
+        
+        返回值：
+        - boto3 SQS客户端实例
+        """
+        if self._sqs_client is None:
+            self._sqs_client = boto3.client(
+                'sqs',
+                endpoint_url=S3_CONFIG["sqs_endpoint_url"],
+                region_name=S3_CONFIG["region_name"],
+                aws_access_key_id=S3_CONFIG["aws_access_key_id"],
+                aws_secret_access_key=S3_CONFIG["aws_secret_access_key"]
+            )
+        return self._sqs_client
     
     def upload_file(self, file, key, bucket=None):
         """
@@ -219,32 +355,327 @@ class S3Service:
         """
         bucket_name = bucket or self.default_bucket
         try:
-            self.s3_client.upload_fileobj(file.file, bucket_name, key)
+            # 确保从文件开头读取
+            file.file.seek(0)
+            self.s3_client.upload_fileobj(
+                file.file, bucket_name, key,
+                ExtraArgs={'ContentType': self._guess_content_type(key)},
+                Config=self.transfer_config
+            )
+            self._invalidate_exists(bucket_name, key)
+            return key
+        except ClientError as e:
+            raise Exception(f"Failed to upload file: {e}")
+    
+    def upload_bytes(self, key, data, bucket=None):
+        """
+        将内存中的数据作为单个对象上传到S3存储桶
+        
+        参数：
+        - key: str，S3对象键
+        - data: bytes，文件内容
+        - bucket: str，可选，存储桶名称，默认为默认存储桶
+        
+        返回值：
+        - str: 上传成功的对象键
+        
+        异常：
+        - Exception: 上传失败时抛出
+        """
+        bucket_name = bucket or self.default_bucket
+        try:
+            self.s3_client.put_object(
+                Bucket=bucket_name, Key=key, Body=data,
+                ContentType=self._guess_content_type(key)
+            )
+            self._invalidate_exists(bucket_name, key)
+            return key
+        except ClientError as e:
+            raise Exception(f"Failed to upload file: {e}")
+    
+    def start_multipart_upload(self, key, bucket=None):
+        """
+        创建分片上传任务
+        
+        参数：
+        - key: str，S3对象键
+        - bucket: str，可选，存储桶名称，默认为默认存储桶
+        
+        返回值：
+        - str: 分片上传任务ID
+        
+        异常：
+        - Exception: 创建失败时抛出
+        """
+        bucket_name = bucket or self.default_bucket
+        try:
+            response = self.s3_client.create_multipart_upload(
+                Bucket=bucket_name, Key=key,
+                ContentType=self._guess_content_type(key)
+            )
+            return response['UploadId']
+        except ClientError as e:
+            raise Exception(f"Failed to upload file: {e}")
+    
+    def upload_part(self, key, upload_id, part_number, data, bucket=None):
+        """
+        上传分片上传任务中的一个分片
+        
+        参数：
+        - key: str，S3对象键
+        - upload_id: str，分片上传任务ID
+        - part_number: int，分片编号，从1开始
+        - data: bytes，分片内容，除最后一个分片外不小于5MB
+        - bucket: str，可选，存储桶名称，默认为默认存储桶
+        
+        返回值：
+        - dict: 包含PartNumber和ETag的分片信息
+        
+        异常：
+        - Exception: 上传失败时抛出
+        """
+        bucket_name = bucket or self.default_bucket
+        try:
+            response = self.s3_client.upload_part(
+                Bucket=bucket_name, Key=key, UploadId=upload_id,
+                PartNumber=part_number, Body=data
+            )
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+        except ClientError as e:
+            raise Exception(f"Failed to upload file: {e}")
+    
+    def complete_multipart_upload(self, key, upload_id, parts, bucket=None):
+        """
+        完成分片上传任务，合并所有分片
+        
+        参数：
+        - key: str，S3对象键
+        - upload_id: str，分片上传任务ID
+        - parts: List[dict]，upload_part返回的分片信息
+        - bucket: str，可选，存储桶名称，默认为默认存储桶
+        
+        返回值：
+        - str: 上传成功的对象键
+        
+        异常：
+        - Exception: 合并失败时抛出
+        """
+        bucket_name = bucket or self.default_bucket
+        try:
+            self.s3_client.complete_multipart_upload(
+                Bucket=bucket_name, Key=key, UploadId=upload_id,
+                MultipartUpload={'Parts': sorted(parts, key=lambda part: part['PartNumber'])}
+            )
+            self._invalidate_exists(bucket_name, key)
             return key
         except ClientError as e:
             raise Exception(f"Failed to upload file: {e}")
     
-    def download_file(self, key, bucket=None):
+    def abort_multipart_upload(self, key, upload_id, bucket=None):
+        """
+        取消分片上传任务，释放已上传的分片
+        
+        参数：
+        - key: str，S3对象键
+        - upload_id: str，分片上传任务ID
+        - bucket: str，可选，存储桶名称，默认为默认存储桶
+        
+        异常：
+        - Exception: 取消失败时抛出
+        """
+        bucket_name = bucket or self.default_bucket
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id)
+        except ClientError as e:
+            raise Exception(f"Failed to abort upload: {e}")
+    
+    def _guess_content_type(self, key):
+        """
+        根据对象键推断文件类型，下载时返回正确的Content-Type
+        
+        参数：
+        - key: str，S3对象键
+        
+        返回值：
+        - str: 文件MIME类型，无法推断时为application/octet-stream
+        """
+        return mimetypes.guess_type(key)[0] or 'application/octet-stream'
+    
+    def download_file(self, key, bucket=None, byte_range=None):
         """
         从S3存储桶下载文件
         
         参数：
         - key: str，S3对象键
         - bucket: str，可选，存储桶名称，默认为默认存储桶
+        - byte_range: str，可选，HTTP Range请求头，只下载对象的指定范围
         
         返回值：
-        - dict: 包含文件内容的响应对象
+        - dict: 包含文件内容的响应对象，指定范围时包含ContentRange
         
         异常：
         - Exception: 下载失败时抛出
         """
         bucket_name = bucket or self.default_bucket
         try:
+            if byte_range:
+                try:
+                    return self.s3_client.get_object(Bucket=bucket_name, Key=key, Range=byte_range)
+                except ClientError as e:
+                    # 空对象不支持范围请求，改为下载整个对象
+                    if e.response['Error']['Code'] != 'InvalidRange':
+                        raise
             response = self.s3_client.get_object(Bucket=bucket_name, Key=key)
             return response
         except ClientError as e:
             raise Exception(f"Failed to download file: {e}")
     
+    def get_file_metadata(self, key, bucket=None):
+        """
+        获取S3对象的元数据，不下载文件内容
+        
+        参数：
+        - key: str，S3对象键
+        - bucket: str，可选，存储桶名称，默认为默认存储桶
+        
+        返回值：
+        - dict: head_object响应，包含ContentLength、ContentType、ETag等
+        
+        异常：
+        - Exception: 获取失败时抛出
+        """
+        bucket_name = bucket or self.default_bucket
+        try:
+            return self.s3_client.head_object(Bucket=bucket_name, Key=key)
+        except ClientError as e:
+            raise Exception(f"Failed to download file: {e}")
+    
+    def download_file_parallel(self, key, bucket=None, metadata=None, offset=0) -> Iterator[bytes]:
+        """
+        使用并发范围请求从S3存储桶下载文件，按顺序返回文件内容，适用于大文件
+        
+        每个文件最多同时请求max_concurrency个分段，已下载的分段被取走后再继续请求，内存占用约为max_concurrency个分段大小；
+        所有请求的分段下载共用一个线程池，总并发数不超过连接池大小
+        
+        参数：
+        - key: str，S3对象键
+        - bucket: str，可选，存储桶名称，默认为默认存储桶
+        - metadata: dict，可选，已获取的对象元数据（ContentLength、ETag），未提供时先请求一次元数据
+        - offset: int，可选，开始下载的位置，默认为0
+        
+        返回值：
+        - Iterator[bytes]: 按顺序返回的文件内容分段
+        
+        异常：
+        - Exception: 下载失败时抛出
+        """
+        bucket_name = bucket or self.default_bucket
+        if metadata is None:
+            metadata = self.get_file_metadata(key, bucket_name)
+        size = metadata['ContentLength']
+        chunk_size = self.download_transfer_config.multipart_chunksize
+        workers = self.download_transfer_config.max_concurrency
+        ranges = iter(range(offset, size, chunk_size))
+        pending = deque()
+        
+        def submit(count):
+            for start in itertools.islice(ranges, count):
+                end = min(start + chunk_size, size) - 1
+                pending.append(self._transfer_executor.submit(
+                    self._get_object_range, bucket_name, key, f"bytes={start}-{end}", metadata['ETag']
+                ))
+        
+        try:
+            submit(workers)
+            while pending:
+                data = pending.popleft().result()
+                submit(1)
+                yield data
+        finally:
+            # 调用方提前停止迭代时取消尚未开始的下载
+            for future in pending:
+                future.cancel()
+    
+    def _get_object_range(self, bucket, key, byte_range, e_tag):
+        """
+        读取S3对象指定范围的内容
+        
+        参数：
+        - bucket: str，存储桶名称
+        - key: str，S3对象键
+        - byte_range: str，HTTP Range请求头
+        - e_tag: str，对象的ETag，下载过程中对象被修改时请求失败
+        
+        返回值：
+        - bytes: 指定范围的内容
+        
+        异常：
+        - Exception: 下载失败时抛出
+        """
+        try:
+            response = self.s3_client.get_object(Bucket=bucket, Key=key, Range=byte_range, IfMatch=e_tag)
+            return response['Body'].read()
+        except ClientError as e:
+            raise Exception(f"Failed to download file: {e}")
+    
+    def get_many(self, keys, bucket=None, max_workers=32) -> Iterator[Tuple[str, bytes]]:
+        """
+        并发从S3存储桶下载多个文件，适用于大量小文件
+        
+        参数：
+        - keys: List[str]，S3对象键列表
+        - bucket: str，可选，存储桶名称，默认为默认存储桶
+        - max_workers: int，可选，本次调用同时进行的最大下载数，默认为32（所有请求共用的线程池另行限制总并发数不超过连接池大小）
+        
+        返回值：
+        - Iterator[Tuple[str, bytes]]: 按完成顺序返回的(对象键, 文件内容)
+        
+        异常：
+        - Exception: 任一文件下载失败时抛出
+        """
+        bucket_name = bucket or self.default_bucket
+        if not keys:
+            return
+        # 最多同时保留max_workers个下载任务，已完成的内容被取走后再提交新任务，内存占用不随批量大小增长
+        pending_keys = iter(keys)
+        
+        def submit(count):
+            for key in itertools.islice(pending_keys, count):
+                futures[self._transfer_executor.submit(self._get_object_bytes, bucket_name, key)] = key
+        
+        futures = {}
+        try:
+            submit(max_workers)
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = futures.pop(future)
+                    yield key, future.result()
+                submit(len(done))
+        finally:
+            # 调用方提前停止迭代时取消尚未开始的下载
+            for future in futures:
+                future.cancel()
+    
+    def _get_object_bytes(self, bucket, key):
+        """
+        读取S3对象的全部内容
+        
+        参数：
+        - bucket: str，存储桶名称
+        - key: str，S3对象键
+        
+        返回值：
+        - bytes: 文件内容
+        
+        异常：
+        - Exception: 下载失败时抛出
+        """
+        try:
+            return self.s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        except ClientError as e:
+            raise Exception(f"Failed to download file {key}: {e}")
+    
     def delete_file(self, key, bucket=None):
         """
         从S3存储桶删除文件
@@ -259,6 +690,7 @@ class S3Service:
         bucket_name = bucket or self.default_bucket
         try:
             self.s3_client.delete_object(Bucket=bucket_name, Key=key)
+            self._invalidate_exists(bucket_name, key)
         except ClientError as e:
             raise Exception(f"Failed to delete file: {e}")
     
@@ -277,13 +709,93 @@ class S3Service:
         - Exception: 检查失败时抛出
         """
         bucket_name = bucket or self.default_bucket
+        cache_key = (bucket_name, key)
+        with self._cache_lock:
+            exists = self._exists_cache.get(cache_key)
+        if exists is not None:
+            return exists
         try:
             self.s3_client.head_object(Bucket=bucket_name, Key=key)
-            return True
+            exists = True
         except ClientError as e:
-            if e.response['Error']['Code'] == '404':
-                return False
-            raise Exception(f"Failed to check file existence: {e}")
+            if e.response['Error']['Code'] != '404':
+                raise Exception(f"Failed to check file existence: {e}")
+            exists = False
+        with self._cache_lock:
+            self._exists_cache[cache_key] = exists
+        return exists
+    
+    def _invalidate_exists(self, bucket, key):
+        """
+        移除文件存在性检查的缓存结果
+        
+        参数：
+        - bucket: str，存储桶名称
+        - key: str，S3对象键
+        """
+        with self._cache_lock:
+            self._exists_cache.pop((bucket, key), None)
+    
+    # S3 Select支持的输入格式及其序列化配置
+    SELECT_INPUT_SERIALIZATION = {
+        'CSV': {'CSV': {'FileHeaderInfo': 'USE'}},
+        'JSON': {'JSON': {'Type': 'DOCUMENT'}},
+        'JSONL': {'JSON': {'Type': 'LINES'}},
+        'Parquet': {'Parquet': {}}
+    }
+    
+    def select(self, key, sql, input_format='JSON', bucket=None) -> Iterator[bytes]:
+        """
+        使用S3 Select在服务端执行SQL表达式，只返回匹配的记录
+        
+        参数：
+        - key: str，S3对象键
+        - sql: str，SQL查询表达式，例如 SELECT s.name FROM S3Object s
+        - input_format: str，可选，对象格式，支持CSV、JSON、JSONL和Parquet，默认为JSON
+        - bucket: str，可选，存储桶名称，默认为默认存储桶
+        
+        返回值：
+        - Iterator[bytes]: 以换行分隔的JSON记录数据块
+        
+        异常：
+        - ValueError: 输入格式不支持时抛出
+        - Exception: 查询失败时抛出
+        """
+        if input_format not in self.SELECT_INPUT_SERIALIZATION:
+            raise ValueError(f"Unsupported input format: {input_format}")
+        bucket_name = bucket or self.default_bucket
+        try:
+            response = self.s3_client.select_object_content(
+                Bucket=bucket_name,
+                Key=key,
+                Expression=sql,
+                ExpressionType='SQL',
+                InputSerialization=self.SELECT_INPUT_SERIALIZATION[input_format],
+                OutputSerialization={'JSON': {}}
+            )
+        except ClientError as e:
+            raise Exception(f"Failed to select file content: {e}")
+        return self._iter_select_records(response['Payload'])
+    
+    def _iter_select_records(self, payload):
+        """
+        从S3 Select事件流中读取记录数据
+        
+        参数：
+        - payload: S3 Select响应中的事件流
+        
+        返回值：
+        - Iterator[bytes]: 记录数据块
+        
+        异常：
+        - Exception: 读取事件流失败时抛出
+        """
+        try:
+            for event in payload:
+                if 'Records' in event:
+                    yield event['Records']['Payload']
+        except ClientError as e:
+            raise Exception(f"Failed to select file content: {e}")
     
     def list_files(self, bucket=None):
         """
@@ -295,21 +807,32 @@ class S3Service:
         返回值：
         - list: 文件列表，每个文件包含key、size和lastModified属性
         
+        异常：
+        - Exception: 列出失败时抛出
+        """
+        return list(self.iter_files(bucket))
+    
+    def iter_files(self, bucket=None) -> Iterator[Dict[str, Any]]:
+        """
+        分页遍历S3存储桶中的所有文件，不受单次列举1000个对象的限制
+        
+        参数：
+        - bucket: str，可选，存储桶名称，默认为默认存储桶
+        
+        返回值：
+        - Iterator[Dict[str, Any]]: 逐个返回文件，每个文件包含key、size和lastModified属性
+        
         异常：
         - Exception: 列出失败时抛出
         """
         bucket_name = bucket or self.default_bucket
         try:
-            response = self.s3_client.list_objects_v2(Bucket=bucket_name)
-            files = []
-            if 'Contents' in response:
-                for file in response['Contents']:
-                    files.append({
-                        'key': file['Key'],
-                        'size': file['Size'],
-                        'lastModified': file['LastModified']
-                    })
-            return files
+            for obj in self._iter_objects(bucket_name):
+                yield {
+                    'key': obj['Key'],
+                    'size': obj['Size'],
+                    'lastModified': obj['LastModified']
+                }
         except ClientError as e:
             raise Exception(f"Failed to list files: {e}")
     
@@ -325,13 +848,10 @@ class S3Service:
         """
         try:
             response = self.s3_client.list_buckets()
-            buckets = []
-            for bucket in response['Buckets']:
-                buckets.append({
-                    'name': bucket['Name'],
-                    'creationDate': bucket['CreationDate']
-                })
-            return buckets
+            return [
+                {'name': bucket['Name'], 'creationDate': bucket['CreationDate']}
+                for bucket in response['Buckets']
+            ]
         except ClientError as e:
             raise Exception(f"Failed to list buckets: {e}")
     
@@ -358,6 +878,8 @@ class S3Service:
                 Bucket=bucket_name,
                 CreateBucketConfiguration={'LocationConstraint': S3_CONFIG["region_name"]}
             )
+            with self._cache_lock:
+                self._bucket_exists_cache[bucket_name] = True
             return True
         except ClientError as e:
             raise Exception(f"Failed to create bucket: {e}")
@@ -375,13 +897,20 @@ class S3Service:
         异常：
         - Exception: 检查失败时抛出
         """
+        with self._cache_lock:
+            exists = self._bucket_exists_cache.get(bucket_name)
+        if exists is not None:
+            return exists
         try:
             self.s3_client.head_bucket(Bucket=bucket_name)
-            return True
+            exists = True
         except ClientError as e:
-            if e.response['Error']['Code'] == '404':
-                return False
-            raise Exception(f"Failed to check bucket existence: {e}")
+            if e.response['Error']['Code'] != '404':
+                raise Exception(f"Failed to check bucket existence: {e}")
+            exists = False
+        with self._cache_lock:
+            self._bucket_exists_cache[bucket_name] = exists
+        return exists
 
     def _list_objects(self, bucket):
         """
@@ -397,11 +926,60 @@ class S3Service:
         - Exception: 列出失败时抛出
         """
         try:
-            response = self.s3_client.list_objects_v2(Bucket=bucket)
-            return response.get('Contents', [])
+            return list(self._iter_objects(bucket))
         except ClientError as e:
             raise Exception(f"Failed to list objects: {e}")
 
+    def _iter_objects(self, bucket):
+        """
+        使用分页器遍历存储桶中的所有对象
+        
+        参数：
+        - bucket: str，存储桶名称
+        
+        返回值：
+        - Iterator[Dict[str, Any]]: 逐个返回list_objects_v2结果中的对象
+        
+        异常：
+        - ClientError: 列出失败时抛出
+        """
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, PaginationConfig={'PageSize': 1000}):
+            yield from page.get('Contents', [])
+
+    def enable_event_notifications(self, bucket, sqs_queue_arn):
+        """
+        配置存储桶将对象创建和删除事件发送到SQS队列
+        
+        写入通知配置会替换存储桶的整个配置，因此先读取现有配置，保留其他SNS、Lambda和队列目标，
+        只替换同一队列的配置项
+        
+        参数：
+        - bucket: str，存储桶名称
+        - sqs_queue_arn: str，接收事件通知的SQS队列ARN，该队列应只接收此存储桶的事件
+        
+        异常：
+        - Exception: 配置失败时抛出
+        """
+        try:
+            notification_config = self.s3_client.get_bucket_notification_configuration(Bucket=bucket)
+            notification_config.pop('ResponseMetadata', None)
+            queue_configs = [
+                queue_config for queue_config in notification_config.get('QueueConfigurations', [])
+                if queue_config['QueueArn'] != sqs_queue_arn
+            ]
+            queue_configs.append({
+                'QueueArn': sqs_queue_arn,
+                'Events': ['s3:ObjectCreated:*', 's3:ObjectRemoved:*']
+            })
+            notification_config['QueueConfigurations'] = queue_configs
+            self.s3_client.put_bucket_notification_configuration(
+                Bucket=bucket,
+                NotificationConfiguration=notification_config
+            )
+        except ClientError as e:
+            raise Exception(f"Failed to enable event notifications: {e}")
+
     def start_bucket_listener(self, config: BucketListenerConfig):
         """
         启动存储桶监听器
@@ -429,7 +1007,8 @@ class S3Service:
         listener.start()
 
         # 添加到监听器列表
-        self.listeners.append(listener)
+        with self._listeners_lock:
+            self.listeners.append(listener)
 
         return listener
 
@@ -437,9 +1016,10 @@ class S3Service:
         """
         停止所有存储桶监听器
         """
-        for listener in self.listeners:
-            listener.stop()
-        self.listeners.clear()
+        with self._listeners_lock:
+            for listener in self.listeners:
+                listener.stop()
+            self.listeners.clear()
     
     def record_event(self, event):
         """
@@ -448,11 +1028,8 @@ class S3Service:
         参数：
         - event: S3Event对象，要记录的事件
         """
-        # 添加事件到历史记录的开头
-        self.event_history.insert(0, event)
-        # 限制历史记录的长度
-        if len(self.event_history) > self.MAX_EVENT_HISTORY:
-            self.event_history.pop()
+        # 添加事件到历史记录的开头，超出长度限制的旧事件自动移除
+        self.event_history.appendleft(event)
     
     def get_event_history(self):
         """
@@ -462,17 +1039,17 @@ class S3Service:
         - list: 事件历史记录列表，每个事件包含event_type、bucket、key、size、last_modified和e_tag属性
         """
         # 转换为前端可以处理的格式
-        events = []
-        for event in self.event_history:
-            events.append({
+        return [
+            {
                 "eventType": event.event_type.value,
                 "bucket": event.bucket,
                 "key": event.key,
                 "size": event.size,
                 "lastModified": event.last_modified,
                 "eTag": event.e_tag
-            })
-        return events
+            }
+            for event in self.event_history
+        ]
     
     def clear_event_history(self):
         """
@@ -493,15 +1070,11 @@ class S3Service:
         异常：
         - Exception: 监听器启动失败时抛出
         """
-        from s3_service import BucketListenerConfig, EventType
-        
-        # 停止所有现有监听器
-        self.stop_all_listeners()
-        
         # 配置监听器
         config = BucketListenerConfig()
         config.bucket = bucket
         config.poll_interval = 5  # 5秒轮询一次
+        config.sqs_queue_url = S3_CONFIG["sqs_queue_url"]  # 配置了SQS队列时改用事件通知
         config.event_handler = lambda event: (
             print(f"S3 Event: {event.event_type.value} - Bucket: {event.bucket}, Key: {event.key}, Size: {event.size}, LastModified: {event.last_modified}"),
             self.record_event(event)
@@ -510,8 +1083,22 @@ class S3Service:
             print(f"S3 Listener Error: {error}")
         )
 
-        # 启动监听器
-        listener = self.start_bucket_listener(config)
+        # 停止所有现有监听器并启动新监听器，持有锁保证期间不会有其他监听器加入
+        with self._listeners_lock:
+            self.stop_all_listeners()
+            listener = self.start_bucket_listener(config)
         print(f"S3 Bucket listener started successfully for bucket: {bucket}")
         
         return listener
+
+@lru_cache(maxsize=1)
+def get_s3_service():
+    """
+    获取进程内唯一的S3服务实例
+
+    首次调用时创建S3Service实例，之后的调用复用同一实例及其boto3客户端连接池
+
+    返回值：
+    - S3Service: S3服务实例
+    """
+    return S3Service()
@@ -3,21 +3,30 @@ S3服务API测试脚本
 
 作者：KO
 创建时间：2026-01-27
-修改时间：2026-01-27
+修改时间：2026-10-15
 
 功能：
 - 测试S3服务的/api/s3/buckets端点
 - 打印响应状态码、头部和内容
 - 尝试将响应解析为JSON并打印
+- 使用连接池复用HTTP连接
 """
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # 测试API端点URL
 url = 'http://127.0.0.1:8000/api/s3/buckets'
 
+# 复用连接的会话，避免每次请求重新建立TCP连接
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=Retry(total=3, backoff_factor=0.1))
+session.mount("http://", adapter)
+session.mount("https://", adapter)
+
 try:
     # 发送GET请求到API端点
-    response = requests.get(url)
+    response = session.get(url)
     
     # 打印响应状态码
     print(f"Status Code: {response.status_code}")
@@ -0,0 +1,171 @@
+"""
+API端点单元测试文件
+
+作者：KO
+创建时间：2026-10-15
+修改时间：2026-10-15
+
+功能：
+- 测试流式分片上传端点的分片、失败中止和小文件直接上传
+- 测试tar打包时对象键到成员名称的转换
+- 使用伪造的S3服务替换依赖注入，避免实际连接到S3服务
+"""
+import threading
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+import main
+from s3_service import get_s3_service
+
+class FakeS3Service:
+    """
+    记录流式上传调用的伪造S3服务
+    """
+
+    def __init__(self, fail_part=None):
+        """
+        初始化伪造服务
+
+        参数：
+        - fail_part: int，可选，上传失败的分片编号
+        """
+        self.fail_part = fail_part
+        self.parts = {}
+        self.uploaded = None
+        self.completed = None
+        self.aborted = False
+        self._lock = threading.Lock()
+
+    def upload_bytes(self, key, data, bucket=None):
+        self.uploaded = data
+        return key
+
+    def start_multipart_upload(self, key, bucket=None):
+        return "upload-id"
+
+    def upload_part(self, key, upload_id, part_number, data, bucket=None):
+        if part_number == self.fail_part:
+            raise Exception("Failed to upload file: part failed")
+        with self._lock:
+            self.parts[part_number] = data
+        return {'PartNumber': part_number, 'ETag': f"etag-{part_number}"}
+
+    def complete_multipart_upload(self, key, upload_id, parts, bucket=None):
+        self.completed = sorted(part['PartNumber'] for part in parts)
+        return key
+
+    def abort_multipart_upload(self, key, upload_id, bucket=None):
+        self.aborted = True
+
+class TestUploadStream(unittest.TestCase):
+    """
+    /api/s3/upload-stream端点的单元测试
+    """
+
+    def setUp(self):
+        """
+        测试前的设置，缩小分片大小以便使用较小的请求体
+        """
+        self.client = TestClient(main.app)
+        # 分片大小为4字节，每2个分片增加4字节
+        for name, value in (('UPLOAD_PART_SIZE', 4), ('PARTS_PER_SIZE_STEP', 2)):
+            patcher = patch.object(main, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(main.app.dependency_overrides.clear)
+
+    def _upload(self, service, body):
+        """
+        使用伪造服务调用流式上传端点
+        """
+        main.app.dependency_overrides[get_s3_service] = lambda: service
+        return self.client.post("/api/s3/upload-stream", params={"key": "test-key"}, content=body)
+
+    def test_upload_stream_multipart(self):
+        """
+        测试请求体按逐渐增大的分片上传并完成合并
+        """
+        service = FakeS3Service()
+        body = bytes(range(30))
+
+        response = self._upload(service, body)
+
+        # 验证分片大小按_part_size增长，合并后与请求体一致
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([len(service.parts[n]) for n in sorted(service.parts)], [4, 4, 8, 8, 6])
+        self.assertEqual(b"".join(service.parts[n] for n in sorted(service.parts)), body)
+        self.assertEqual(service.completed, [1, 2, 3, 4, 5])
+        self.assertFalse(service.aborted)
+
+    def test_upload_stream_part_failure(self):
+        """
+        测试分片上传失败时停止上传并中止分片上传任务
+        """
+        service = FakeS3Service(fail_part=2)
+
+        with patch.object(main, 'PARTS_PER_SIZE_STEP', 1000):
+            response = self._upload(service, bytes(400))
+
+        # 验证返回500，中止上传且没有合并，失败后没有继续上传剩余的分片
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("part failed", response.json()["detail"])
+        self.assertTrue(service.aborted)
+        self.assertIsNone(service.completed)
+        self.assertLess(len(service.parts), 50)
+
+    def test_upload_stream_part_limit(self):
+        """
+        测试分片数超过上限时上传失败并中止
+        """
+        service = FakeS3Service()
+
+        with patch.object(main, 'MAX_UPLOAD_PARTS', 3):
+            response = self._upload(service, bytes(40))
+
+        # 验证返回500且中止上传
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("maximum of 3 parts", response.json()["detail"])
+        self.assertTrue(service.aborted)
+        self.assertIsNone(service.completed)
+
+    def test_upload_stream_small_body(self):
+        """
+        测试请求体不足一个分片（包括空请求体）时直接上传
+        """
+        for body in (b"abc", b""):
+            with self.subTest(size=len(body)):
+                service = FakeS3Service()
+
+                response = self._upload(service, body)
+
+                # 验证直接上传了完整的请求体，没有创建分片上传任务
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(service.uploaded, body)
+                self.assertEqual(service.parts, {})
+                self.assertIsNone(service.completed)
+
+class TestTarMemberName(unittest.TestCase):
+    """
+    _tar_member_name函数的单元测试
+    """
+
+    def test_tar_member_name(self):
+        """
+        测试对象键中的绝对路径和上级目录被去除
+        """
+        cases = [
+            ("a/b.txt", "a/b.txt"),
+            ("../x", "x"),
+            ("/etc/passwd", "etc/passwd"),
+            ("a/./b/../c", "a/b/c"),
+            ("a\\..\\b", "a/b"),
+            ("..", "_"),
+            ("", "_"),
+        ]
+        for key, expected in cases:
+            with self.subTest(key=key):
+                self.assertEqual(main._tar_member_name(key), expected)
+
+if __name__ == '__main__':
+    import pytest
+    raise SystemExit(pytest.main([__file__]))
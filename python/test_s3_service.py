@@ -3,218 +3,346 @@ S3服务单元测试文件
 
 作者：KO
 创建时间：2026-01-28
-修改时间：2026-01-28
+修改时间：2026-10-15
 
 功能：
 - 测试S3Service类的所有方法
 - 使用mock模拟boto3客户端，避免实际连接到S3服务
 - 测试正常情况和异常情况
 """
+import json
 import unittest
+from datetime import datetime, timezone
 from unittest.mock import Mock, patch, MagicMock
-from s3_service import S3Service
+from botocore.exceptions import ClientError
+from s3_service import S3Service, BucketListener, BucketListenerConfig, EventType
+
+# 测试共用的S3错误响应
+_ERR_500 = {'Error': {'Code': '500', 'Message': 'Internal Server Error'}}
+_ERR_404 = {'Error': {'Code': '404', 'Message': 'Not Found'}}
+_CE_500 = ClientError(_ERR_500, 'Op')
+_CE_404 = ClientError(_ERR_404, 'HeadObject')
+
+# S3Service调用的客户端方法（SQS客户端同样由被补丁的boto3.client创建，因此包含SQS方法）
+S3_CLIENT_METHODS = [
+    'upload_fileobj', 'get_object', 'put_object', 'delete_object',
+    'head_object', 'get_paginator', 'list_buckets', 'create_bucket', 'head_bucket',
+    'select_object_content', 'create_multipart_upload', 'upload_part',
+    'complete_multipart_upload', 'abort_multipart_upload',
+    'get_bucket_notification_configuration', 'put_bucket_notification_configuration',
+    'receive_message', 'delete_message_batch'
+]
+
+def _make_file():
+    """
+    创建mock上传文件对象，只包含upload_file使用到的属性
+    """
+    mock_file = Mock(spec=['file'])
+    mock_file.file = Mock(spec=['seek', 'read'])
+    return mock_file
 
 class TestS3Service(unittest.TestCase):
     """
     S3Service类的单元测试
     """
     
-    def setUp(self):
+    @classmethod
+    def setUpClass(cls):
         """
-        测试前的设置
+        测试类的设置，所有测试共享同一个补丁和S3Service实例
         """
         # 补丁boto3.client，返回一个mock对象
-        self.boto3_client_patcher = patch('s3_service.boto3.client')
-        self.mock_boto3_client = self.boto3_client_patcher.start()
+        cls._patcher = patch('s3_service.boto3.client')
+        cls.mock_boto3_client = cls._patcher.start()
         
-        # 创建mock s3客户端
-        self.mock_s3_client = Mock()
-        self.mock_boto3_client.return_value = self.mock_s3_client
+        # 创建mock s3客户端，只允许访问服务实际调用的客户端方法，拼写错误会直接报错
+        cls.mock_s3_client = MagicMock(spec_set=S3_CLIENT_METHODS)
+        cls.mock_boto3_client.return_value = cls.mock_s3_client
         
         # 创建S3Service实例
-        self.s3_service = S3Service()
+        cls.s3_service = S3Service()
+        
+        # 只需传递给upload_fileobj的mock文件对象在所有测试中共用
+        cls._mock_file = _make_file()
     
-    def tearDown(self):
+    @classmethod
+    def tearDownClass(cls):
         """
-        测试后的清理
+        测试类的清理
         """
         # 停止补丁
-        self.boto3_client_patcher.stop()
+        cls._patcher.stop()
     
-    def test_upload_file_success(self):
+    def setUp(self):
         """
-        测试上传文件成功的情况
+        测试前的设置
         """
-        # 创建mock文件对象
-        mock_file = Mock()
-        mock_file.file = Mock()
-        
-        # 设置mock s3客户端的upload_fileobj方法
-        self.mock_s3_client.upload_fileobj.return_value = None
+        self._reset_mocks()
+    
+    def _reset_mocks(self):
+        """
+        重置共享的mock对象和缓存，每个测试及每个子测试开始前调用
+        """
+        # 重置mock s3客户端和mock文件对象的调用记录、返回值和异常设置
+        self.mock_s3_client.reset_mock(return_value=True, side_effect=True)
+        self._mock_file.reset_mock()
+        # 清空存在性检查缓存，避免测试之间相互影响
+        self.s3_service._exists_cache.clear()
+        self.s3_service._bucket_exists_cache.clear()
+    
+    # 失败场景：(抛出异常的客户端方法, 调用的服务方法, 预期的异常消息)
+    FAILURE_CASES = [
+        ('upload_fileobj', lambda s: s.upload_file(_make_file(), 'test-key'), 'Failed to upload file'),
+        ('get_object', lambda s: s.download_file('test-key'), 'Failed to download file'),
+        ('delete_object', lambda s: s.delete_file('test-key'), 'Failed to delete file'),
+        ('get_paginator', lambda s: s.list_files(), 'Failed to list files'),
+        ('list_buckets', lambda s: s.list_buckets(), 'Failed to list buckets'),
+        ('create_bucket', lambda s: s.create_bucket('new-bucket'), 'Failed to create bucket'),
+        ('head_bucket', lambda s: s._bucket_exists('test-bucket'), 'Failed to check bucket existence'),
+    ]
+    
+    def test_all_failure_paths(self):
+        """
+        测试S3客户端抛出ClientError时各服务方法的失败情况
+        """
+        for attr, call, expected in self.FAILURE_CASES:
+            with self.subTest(case=attr):
+                self._reset_mocks()
+                # 存储桶不存在，使create_bucket继续执行创建操作
+                self.mock_s3_client.head_bucket.side_effect = _CE_404
+                # 设置mock s3客户端方法，抛出ClientError异常
+                getattr(self.mock_s3_client, attr).side_effect = _CE_500
+                
+                # 验证调用服务方法会抛出包含预期内容的异常
+                with self.assertRaisesRegex(Exception, expected):
+                    call(self.s3_service)
+    
+    def _bucket_cases(self):
+        """
+        存储桶参数的测试场景：(传入的存储桶参数, 预期使用的存储桶)
+        """
+        return [(None, self.s3_service.default_bucket), ("custom-bucket", "custom-bucket")]
+    
+    def _check_upload(self, arg, expected_bucket):
+        """
+        上传文件并验证使用的存储桶和参数
+        """
+        mock_file = self._mock_file
         
-        # 调用upload_file方法
-        result = self.s3_service.upload_file(mock_file, "test-key")
+        # 调用upload_file方法，未指定存储桶时使用默认存储桶
+        if arg:
+            result = self.s3_service.upload_file(mock_file, "test-key", arg)
+        else:
+            result = self.s3_service.upload_file(mock_file, "test-key")
         
         # 验证结果
         self.assertEqual(result, "test-key")
         # 验证upload_fileobj方法被调用
-        self.mock_s3_client.upload_fileobj.assert_called_once_with(
-            mock_file.file, self.s3_service.default_bucket, "test-key"
-        )
+        self.assertEqual(self.mock_s3_client.upload_fileobj.call_count, 1)
+        call = self.mock_s3_client.upload_fileobj.call_args
+        self.assertIs(call.args[0], mock_file.file)
+        self.assertEqual(call.args[1:], (expected_bucket, "test-key"))
+        self.assertEqual(call.kwargs['ExtraArgs'], {'ContentType': 'application/octet-stream'})
+        self.assertIs(call.kwargs['Config'], self.s3_service.transfer_config)
     
-    def test_upload_file_with_custom_bucket(self):
+    def test_upload_file_success(self):
         """
-        测试使用自定义存储桶上传文件的情况
+        测试上传文件成功的情况，包括默认存储桶和自定义存储桶
         """
-        # 创建mock文件对象
-        mock_file = Mock()
-        mock_file.file = Mock()
-        
-        # 设置mock s3客户端的upload_fileobj方法
-        self.mock_s3_client.upload_fileobj.return_value = None
-        
-        # 调用upload_file方法，指定自定义存储桶
-        custom_bucket = "custom-bucket"
-        result = self.s3_service.upload_file(mock_file, "test-key", custom_bucket)
-        
-        # 验证结果
-        self.assertEqual(result, "test-key")
-        # 验证upload_fileobj方法被调用，使用了自定义存储桶
-        self.mock_s3_client.upload_fileobj.assert_called_once_with(
-            mock_file.file, custom_bucket, "test-key"
-        )
+        for arg, expected_bucket in self._bucket_cases():
+            with self.subTest(bucket=arg):
+                self._reset_mocks()
+                self._check_upload(arg, expected_bucket)
     
-    def test_upload_file_failure(self):
+    def test_upload_file_content_type(self):
         """
-        测试上传文件失败的情况
+        测试上传文件时根据对象键设置Content-Type
         """
         # 创建mock文件对象
-        mock_file = Mock()
-        mock_file.file = Mock()
-        
-        # 导入ClientError
-        from botocore.exceptions import ClientError
-        
-        # 设置mock s3客户端的upload_fileobj方法，抛出ClientError异常
-        error_response = {'Error': {'Code': '500', 'Message': 'Internal Server Error'}}
-        self.mock_s3_client.upload_fileobj.side_effect = ClientError(
-            error_response, 'UploadFileObj'
-        )
+        mock_file = self._mock_file
         
-        # 验证调用upload_file方法会抛出异常
-        with self.assertRaises(Exception) as context:
-            self.s3_service.upload_file(mock_file, "test-key")
+        # 调用upload_file方法
+        self.s3_service.upload_file(mock_file, "image.png")
         
-        # 验证异常消息包含预期内容
-        self.assertIn("Failed to upload file", str(context.exception))
+        # 验证upload_fileobj方法使用了推断出的Content-Type
+        call = self.mock_s3_client.upload_fileobj.call_args
+        self.assertEqual(call.kwargs['ExtraArgs'], {'ContentType': 'image/png'})
     
-    def test_download_file_success(self):
+    def test_multipart_upload_success(self):
         """
-        测试下载文件成功的情况
+        测试分片上传成功的情况
         """
-        # 设置mock响应
-        mock_response = {"Body": Mock(), "ContentLength": 100}
-        self.mock_s3_client.get_object.return_value = mock_response
+        # 设置mock s3客户端的分片上传方法
+        self.mock_s3_client.create_multipart_upload.return_value = {'UploadId': 'upload-id'}
+        self.mock_s3_client.upload_part.side_effect = lambda **kwargs: {'ETag': f"etag-{kwargs['PartNumber']}"}
         
-        # 调用download_file方法
-        result = self.s3_service.download_file("test-key")
+        # 创建任务，乱序上传两个分片后完成上传
+        upload_id = self.s3_service.start_multipart_upload("test.txt")
+        part2 = self.s3_service.upload_part("test.txt", upload_id, 2, b"b")
+        part1 = self.s3_service.upload_part("test.txt", upload_id, 1, b"a")
+        result = self.s3_service.complete_multipart_upload("test.txt", upload_id, [part2, part1])
         
         # 验证结果
-        self.assertEqual(result, mock_response)
-        # 验证get_object方法被调用
-        self.mock_s3_client.get_object.assert_called_once_with(
-            Bucket=self.s3_service.default_bucket, Key="test-key"
+        self.assertEqual(result, "test.txt")
+        self.assertEqual(
+            self.mock_s3_client.create_multipart_upload.call_args.kwargs['ContentType'], 'text/plain'
+        )
+        # 验证分片按编号排序后合并
+        self.mock_s3_client.complete_multipart_upload.assert_called_once_with(
+            Bucket=self.s3_service.default_bucket, Key="test.txt", UploadId="upload-id",
+            MultipartUpload={'Parts': [
+                {'PartNumber': 1, 'ETag': 'etag-1'},
+                {'PartNumber': 2, 'ETag': 'etag-2'}
+            ]}
         )
     
-    def test_download_file_with_custom_bucket(self):
+    def test_multipart_upload_failure(self):
         """
-        测试使用自定义存储桶下载文件的情况
+        测试上传分片失败的情况
         """
-        # 设置mock响应
-        mock_response = {"Body": Mock(), "ContentLength": 100}
-        self.mock_s3_client.get_object.return_value = mock_response
+        # 设置mock s3客户端的upload_part方法，抛出ClientError异常
+        self.mock_s3_client.upload_part.side_effect = _CE_500
         
-        # 调用download_file方法，指定自定义存储桶
-        custom_bucket = "custom-bucket"
-        result = self.s3_service.download_file("test-key", custom_bucket)
-        
-        # 验证结果
+        # 验证调用upload_part方法会抛出异常
+        with self.assertRaisesRegex(Exception, r"Failed to upload file"):
+            self.s3_service.upload_part("test-key", "upload-id", 1, b"data")
+    
+    def test_download_file_success(self):
+        """
+        测试下载文件成功的情况，包括默认存储桶和自定义存储桶
+        """
+        for arg, expected_bucket in self._bucket_cases():
+            with self.subTest(bucket=arg):
+                self._reset_mocks()
+                # 设置mock响应
+                mock_response = {"Body": Mock(), "ContentLength": 100}
+                self.mock_s3_client.get_object.return_value = mock_response
+                
+                # 调用download_file方法
+                result = self.s3_service.download_file("test-key", arg)
+                
+                # 验证结果
+                self.assertEqual(result, mock_response)
+                # 验证get_object方法被调用
+                self.mock_s3_client.get_object.assert_called_once_with(
+                    Bucket=expected_bucket, Key="test-key"
+                )
+
+    def test_download_file_range_empty_object(self):
+        """
+        测试范围下载空对象时改为下载整个对象
+        """
+        # 设置mock s3客户端的get_object方法，范围请求返回InvalidRange错误
+        mock_response = {"Body": Mock(), "ContentLength": 0}
+        invalid_range = ClientError({'Error': {'Code': 'InvalidRange', 'Message': 'Invalid Range'}}, 'GetObject')
+        self.mock_s3_client.get_object.side_effect = [invalid_range, mock_response]
+
+        # 调用download_file方法
+        result = self.s3_service.download_file("test-key", byte_range="bytes=0-99")
+
+        # 验证结果，第二次请求不包含Range
         self.assertEqual(result, mock_response)
-        # 验证get_object方法被调用，使用了自定义存储桶
-        self.mock_s3_client.get_object.assert_called_once_with(
-            Bucket=custom_bucket, Key="test-key"
-        )
+        self.assertNotIn("Range", self.mock_s3_client.get_object.call_args.kwargs)
+
+    def test_download_file_parallel_success(self):
+        """
+        测试并发下载大文件成功的情况
+        """
+        content = bytes(range(256)) * 100
+        chunk_size = self.s3_service.download_transfer_config.multipart_chunksize
+        
+        # 设置mock s3客户端的get_object方法，按Range请求头返回对应范围的内容
+        def get_object(Bucket, Key, Range, IfMatch):
+            start, end = map(int, Range[len("bytes="):].split("-"))
+            return {"Body": Mock(read=Mock(return_value=content[start:end + 1]))}
+        self.mock_s3_client.get_object.side_effect = get_object
+        
+        # 使用已获取的元数据调用download_file_parallel方法，缩小分段大小使文件被分为多段
+        metadata = {"ContentLength": len(content), "ETag": "etag"}
+        self.s3_service.download_transfer_config.multipart_chunksize = 1000
+        try:
+            result = b"".join(self.s3_service.download_file_parallel("test-key", metadata=metadata))
+        finally:
+            self.s3_service.download_transfer_config.multipart_chunksize = chunk_size
+        
+        # 验证结果按顺序拼接，且没有再次请求元数据
+        self.assertEqual(result, content)
+        self.assertEqual(self.mock_s3_client.get_object.call_count, 26)
+        self.mock_s3_client.head_object.assert_not_called()
+        # 验证范围请求校验了ETag
+        self.assertEqual(self.mock_s3_client.get_object.call_args.kwargs["IfMatch"], "etag")
     
-    def test_download_file_failure(self):
+    def test_download_file_parallel_failure(self):
         """
-        测试下载文件失败的情况
+        测试并发下载大文件失败的情况
         """
-        # 导入ClientError
-        from botocore.exceptions import ClientError
-        
-        # 设置mock s3客户端的get_object方法，抛出ClientError异常
-        error_response = {'Error': {'Code': '500', 'Message': 'Internal Server Error'}}
-        self.mock_s3_client.get_object.side_effect = ClientError(
-            error_response, 'GetObject'
-        )
+        # 设置mock s3客户端的head_object方法，抛出ClientError异常
+        self.mock_s3_client.head_object.side_effect = _CE_500
         
-        # 验证调用download_file方法会抛出异常
-        with self.assertRaises(Exception) as context:
-            self.s3_service.download_file("test-key")
-        
-        # 验证异常消息包含预期内容
-        self.assertIn("Failed to download file", str(context.exception))
+        # 验证迭代download_file_parallel结果会抛出异常
+        with self.assertRaisesRegex(Exception, r"Failed to download file"):
+            list(self.s3_service.download_file_parallel("test-key"))
     
-    def test_delete_file_success(self):
+    def test_get_many_success(self):
         """
-        测试删除文件成功的情况
+        测试并发批量下载文件成功的情况
         """
-        # 设置mock s3客户端的delete_object方法
-        self.mock_s3_client.delete_object.return_value = None
+        # 设置mock s3客户端的get_object方法，按对象键返回文件内容
+        self.mock_s3_client.get_object.side_effect = lambda Bucket, Key: {
+            "Body": Mock(read=Mock(return_value=Key.encode()))
+        }
         
-        # 调用delete_file方法
-        self.s3_service.delete_file("test-key")
+        # 调用get_many方法
+        result = dict(self.s3_service.get_many(["a.txt", "b.txt"]))
         
-        # 验证delete_object方法被调用
-        self.mock_s3_client.delete_object.assert_called_once_with(
-            Bucket=self.s3_service.default_bucket, Key="test-key"
-        )
+        # 验证结果
+        self.assertEqual(result, {"a.txt": b"a.txt", "b.txt": b"b.txt"})
+        self.assertEqual(self.mock_s3_client.get_object.call_count, 2)
     
-    def test_delete_file_with_custom_bucket(self):
+    def test_get_many_bounded_window(self):
         """
-        测试使用自定义存储桶删除文件的情况
+        测试批量下载只提交有限数量的下载任务，取走结果后才继续提交
         """
-        # 设置mock s3客户端的delete_object方法
-        self.mock_s3_client.delete_object.return_value = None
+        self.mock_s3_client.get_object.side_effect = lambda Bucket, Key: {
+            "Body": Mock(read=Mock(return_value=Key.encode()))
+        }
         
-        # 调用delete_file方法，指定自定义存储桶
-        custom_bucket = "custom-bucket"
-        self.s3_service.delete_file("test-key", custom_bucket)
+        # 只取第一个结果后停止迭代
+        files = self.s3_service.get_many([f"{i}.txt" for i in range(100)], max_workers=1)
+        next(files)
+        files.close()
         
-        # 验证delete_object方法被调用，使用了自定义存储桶
-        self.mock_s3_client.delete_object.assert_called_once_with(
-            Bucket=custom_bucket, Key="test-key"
-        )
+        # 验证只下载了max_workers个文件
+        self.assertEqual(self.mock_s3_client.get_object.call_count, 1)
     
-    def test_delete_file_failure(self):
+    def test_get_many_failure(self):
         """
-        测试删除文件失败的情况
+        测试并发批量下载文件失败的情况
         """
-        # 导入ClientError
-        from botocore.exceptions import ClientError
-        
-        # 设置mock s3客户端的delete_object方法，抛出ClientError异常
-        error_response = {'Error': {'Code': '500', 'Message': 'Internal Server Error'}}
-        self.mock_s3_client.delete_object.side_effect = ClientError(
-            error_response, 'DeleteObject'
-        )
-        
-        # 验证调用delete_file方法会抛出异常
-        with self.assertRaises(Exception) as context:
-            self.s3_service.delete_file("test-key")
+        # 设置mock s3客户端的get_object方法，抛出ClientError异常
+        self.mock_s3_client.get_object.side_effect = _CE_500
         
-        # 验证异常消息包含预期内容
-        self.assertIn("Failed to delete file", str(context.exception))
+        # 验证迭代get_many结果会抛出异常
+        with self.assertRaisesRegex(Exception, r"Failed to download file"):
+            list(self.s3_service.get_many(["a.txt"]))
+    
+    def test_delete_file_success(self):
+        """
+        测试删除文件成功的情况，包括默认存储桶和自定义存储桶
+        """
+        for arg, expected_bucket in self._bucket_cases():
+            with self.subTest(bucket=arg):
+                self._reset_mocks()
+                # 设置mock s3客户端的delete_object方法
+                self.mock_s3_client.delete_object.return_value = None
+                
+                # 调用delete_file方法
+                self.s3_service.delete_file("test-key", arg)
+                
+                # 验证delete_object方法被调用
+                self.mock_s3_client.delete_object.assert_called_once_with(
+                    Bucket=expected_bucket, Key="test-key"
+                )
     
     def test_file_exists_true(self):
         """
@@ -237,14 +365,8 @@ class TestS3Service(unittest.TestCase):
         """
         测试文件不存在的情况
         """
-        # 导入ClientError
-        from botocore.exceptions import ClientError
-        
         # 设置mock s3客户端的head_object方法，抛出404错误
-        error_response = {'Error': {'Code': '404', 'Message': 'Not Found'}}
-        self.mock_s3_client.head_object.side_effect = ClientError(
-            error_response, 'HeadObject'
-        )
+        self.mock_s3_client.head_object.side_effect = _CE_404
         
         # 调用file_exists方法
         result = self.s3_service.file_exists("test-key")
@@ -256,51 +378,110 @@ class TestS3Service(unittest.TestCase):
         """
         测试检查文件存在时发生错误的情况
         """
-        # 导入ClientError
-        from botocore.exceptions import ClientError
-        
         # 设置mock s3客户端的head_object方法，抛出非404错误
-        error_response = {'Error': {'Code': '500', 'Message': 'Internal Server Error'}}
-        self.mock_s3_client.head_object.side_effect = ClientError(
-            error_response, 'HeadObject'
-        )
+        self.mock_s3_client.head_object.side_effect = _CE_500
         
         # 验证调用file_exists方法会抛出异常
-        with self.assertRaises(Exception) as context:
+        with self.assertRaisesRegex(Exception, r"Failed to check file existence"):
             self.s3_service.file_exists("test-key")
+    
+    def test_file_exists_cached(self):
+        """
+        测试短时间内重复检查文件存在时使用缓存结果
+        """
+        # 设置mock s3客户端的head_object方法
+        self.mock_s3_client.head_object.return_value = None
+        
+        # 连续两次调用file_exists方法
+        self.assertTrue(self.s3_service.file_exists("test-key"))
+        self.assertTrue(self.s3_service.file_exists("test-key"))
+        
+        # 验证head_object方法只被调用一次
+        self.mock_s3_client.head_object.assert_called_once()
+    
+    def test_file_exists_cache_invalidated_on_delete(self):
+        """
+        测试删除文件后文件存在性缓存失效
+        """
+        # 设置mock s3客户端的head_object方法
+        self.mock_s3_client.head_object.return_value = None
+        
+        # 检查文件存在，删除文件后再次检查
+        self.s3_service.file_exists("test-key")
+        self.s3_service.delete_file("test-key")
+        self.s3_service.file_exists("test-key")
+        
+        # 验证head_object方法被调用两次
+        self.assertEqual(self.mock_s3_client.head_object.call_count, 2)
+    
+    def test_select_success(self):
+        """
+        测试使用S3 Select查询文件内容成功的情况
+        """
+        # 设置mock s3客户端的select_object_content方法，返回事件流
+        self.mock_s3_client.select_object_content.return_value = {
+            'Payload': [
+                {'Records': {'Payload': b'{"a":1}\n'}},
+                {'Stats': {}},
+                {'Records': {'Payload': b'{"a":2}\n'}},
+                {'End': {}}
+            ]
+        }
         
-        # 验证异常消息包含预期内容
-        self.assertIn("Failed to check file existence", str(context.exception))
+        # 调用select方法
+        result = b"".join(self.s3_service.select("data.csv", "SELECT s.a FROM S3Object s", "CSV"))
+        
+        # 验证只返回记录数据
+        self.assertEqual(result, b'{"a":1}\n{"a":2}\n')
+        call = self.mock_s3_client.select_object_content.call_args
+        self.assertEqual(call.kwargs['InputSerialization'], {'CSV': {'FileHeaderInfo': 'USE'}})
+    
+    def test_select_failure(self):
+        """
+        测试使用S3 Select查询文件内容失败的情况
+        """
+        # 验证不支持的输入格式会抛出ValueError
+        with self.assertRaises(ValueError):
+            self.s3_service.select("data.txt", "SELECT * FROM S3Object", "XML")
+        
+        # 设置mock s3客户端的select_object_content方法，抛出ClientError异常
+        self.mock_s3_client.select_object_content.side_effect = _CE_500
+        
+        # 验证调用select方法会抛出异常
+        with self.assertRaisesRegex(Exception, r"Failed to select file content"):
+            self.s3_service.select("data.csv", "SELECT * FROM S3Object")
     
     def test_list_files_empty(self):
         """
         测试列出空存储桶中的文件
         """
-        # 设置mock s3客户端的list_objects_v2方法，返回空内容
-        self.mock_s3_client.list_objects_v2.return_value = {}
+        # 设置mock分页器，返回没有内容的分页
+        mock_paginator = self.mock_s3_client.get_paginator.return_value
+        mock_paginator.paginate.return_value = [{}]
         
         # 调用list_files方法
         result = self.s3_service.list_files()
         
         # 验证结果
         self.assertEqual(result, [])
-        # 验证list_objects_v2方法被调用
-        self.mock_s3_client.list_objects_v2.assert_called_once_with(
-            Bucket=self.s3_service.default_bucket
+        # 验证使用list_objects_v2分页器
+        self.mock_s3_client.get_paginator.assert_called_once_with('list_objects_v2')
+        mock_paginator.paginate.assert_called_once_with(
+            Bucket=self.s3_service.default_bucket, PaginationConfig={'PageSize': 1000}
         )
     
     def test_list_files_with_contents(self):
         """
         测试列出非空存储桶中的文件
         """
-        # 设置mock s3客户端的list_objects_v2方法，返回包含文件的响应
-        mock_response = {
+        # 设置mock分页器，返回包含文件的分页
+        mock_pages = [{
             'Contents': [
                 {'Key': 'file1.txt', 'Size': 100, 'LastModified': Mock()},
                 {'Key': 'file2.txt', 'Size': 200, 'LastModified': Mock()}
             ]
-        }
-        self.mock_s3_client.list_objects_v2.return_value = mock_response
+        }]
+        self.mock_s3_client.get_paginator.return_value.paginate.return_value = mock_pages
         
         # 调用list_files方法
         result = self.s3_service.list_files()
@@ -312,25 +493,22 @@ class TestS3Service(unittest.TestCase):
         self.assertEqual(result[1]['key'], 'file2.txt')
         self.assertEqual(result[1]['size'], 200)
     
-    def test_list_files_failure(self):
+    def test_list_files_multiple_pages(self):
         """
-        测试列出文件失败的情况
+        测试列出超过一页的文件
         """
-        # 导入ClientError
-        from botocore.exceptions import ClientError
+        # 设置mock分页器，返回两页文件
+        mock_pages = [
+            {'Contents': [{'Key': 'file1.txt', 'Size': 100, 'LastModified': Mock()}]},
+            {'Contents': [{'Key': 'file2.txt', 'Size': 200, 'LastModified': Mock()}]}
+        ]
+        self.mock_s3_client.get_paginator.return_value.paginate.return_value = mock_pages
         
-        # 设置mock s3客户端的list_objects_v2方法，抛出ClientError异常
-        error_response = {'Error': {'Code': '500', 'Message': 'Internal Server Error'}}
-        self.mock_s3_client.list_objects_v2.side_effect = ClientError(
-            error_response, 'ListObjectsV2'
-        )
+        # 调用iter_files方法
+        result = list(self.s3_service.iter_files())
         
-        # 验证调用list_files方法会抛出异常
-        with self.assertRaises(Exception) as context:
-            self.s3_service.list_files()
-        
-        # 验证异常消息包含预期内容
-        self.assertIn("Failed to list files", str(context.exception))
+        # 验证所有分页的文件都被返回
+        self.assertEqual([f['key'] for f in result], ['file1.txt', 'file2.txt'])
     
     def test_list_buckets(self):
         """
@@ -353,78 +531,37 @@ class TestS3Service(unittest.TestCase):
         self.assertEqual(result[0]['name'], 'bucket1')
         self.assertEqual(result[1]['name'], 'bucket2')
     
-    def test_list_buckets_failure(self):
-        """
-        测试列出存储桶失败的情况
-        """
-        # 导入ClientError
-        from botocore.exceptions import ClientError
-        
-        # 设置mock s3客户端的list_buckets方法，抛出ClientError异常
-        error_response = {'Error': {'Code': '500', 'Message': 'Internal Server Error'}}
-        self.mock_s3_client.list_buckets.side_effect = ClientError(
-            error_response, 'ListBuckets'
-        )
-        
-        # 验证调用list_buckets方法会抛出异常
-        with self.assertRaises(Exception) as context:
-            self.s3_service.list_buckets()
-        
-        # 验证异常消息包含预期内容
-        self.assertIn("Failed to list buckets", str(context.exception))
-    
     def test_create_bucket_success(self):
         """
         测试创建存储桶成功的情况
         """
-        # 补丁_bucket_exists方法，返回False
-        with patch.object(self.s3_service, '_bucket_exists', return_value=False):
-            # 设置mock s3客户端的create_bucket方法
-            self.mock_s3_client.create_bucket.return_value = None
-            
-            # 调用create_bucket方法
-            result = self.s3_service.create_bucket("new-bucket")
-            
-            # 验证结果
-            self.assertTrue(result)
-            # 验证create_bucket方法被调用
-            self.mock_s3_client.create_bucket.assert_called_once()
+        # 设置mock s3客户端的head_bucket方法，返回404表示存储桶不存在
+        self.mock_s3_client.head_bucket.side_effect = _CE_404
+        # 设置mock s3客户端的create_bucket方法
+        self.mock_s3_client.create_bucket.return_value = None
+        
+        # 调用create_bucket方法
+        result = self.s3_service.create_bucket("new-bucket")
+        
+        # 验证结果
+        self.assertTrue(result)
+        # 验证create_bucket方法被调用
+        self.mock_s3_client.create_bucket.assert_called_once()
     
     def test_create_bucket_already_exists(self):
         """
         测试创建已存在的存储桶
         """
-        # 补丁_bucket_exists方法，返回True
-        with patch.object(self.s3_service, '_bucket_exists', return_value=True):
-            # 调用create_bucket方法
-            result = self.s3_service.create_bucket("existing-bucket")
-            
-            # 验证结果
-            self.assertFalse(result)
-            # 验证create_bucket方法没有被调用
-            self.mock_s3_client.create_bucket.assert_not_called()
-    
-    def test_create_bucket_failure(self):
-        """
-        测试创建存储桶失败的情况
-        """
-        # 补丁_bucket_exists方法，返回False
-        with patch.object(self.s3_service, '_bucket_exists', return_value=False):
-            # 导入ClientError
-            from botocore.exceptions import ClientError
-            
-            # 设置mock s3客户端的create_bucket方法，抛出ClientError异常
-            error_response = {'Error': {'Code': '500', 'Message': 'Internal Server Error'}}
-            self.mock_s3_client.create_bucket.side_effect = ClientError(
-                error_response, 'CreateBucket'
-            )
-            
-            # 验证调用create_bucket方法会抛出异常
-            with self.assertRaises(Exception) as context:
-                self.s3_service.create_bucket("new-bucket")
-            
-            # 验证异常消息包含预期内容
-            self.assertIn("Failed to create bucket", str(context.exception))
+        # 设置mock s3客户端的head_bucket方法，正常返回表示存储桶已存在
+        self.mock_s3_client.head_bucket.return_value = None
+        
+        # 调用create_bucket方法
+        result = self.s3_service.create_bucket("existing-bucket")
+        
+        # 验证结果
+        self.assertFalse(result)
+        # 验证create_bucket方法没有被调用
+        self.mock_s3_client.create_bucket.assert_not_called()
     
     def test_bucket_exists_true(self):
         """
@@ -447,14 +584,8 @@ class TestS3Service(unittest.TestCase):
         """
         测试存储桶不存在的情况
         """
-        # 导入ClientError
-        from botocore.exceptions import ClientError
-        
         # 设置mock s3客户端的head_bucket方法，抛出404错误
-        error_response = {'Error': {'Code': '404', 'Message': 'Not Found'}}
-        self.mock_s3_client.head_bucket.side_effect = ClientError(
-            error_response, 'HeadBucket'
-        )
+        self.mock_s3_client.head_bucket.side_effect = _CE_404
         
         # 通过访问私有方法来测试
         result = self.s3_service._bucket_exists("non-existent-bucket")
@@ -462,25 +593,145 @@ class TestS3Service(unittest.TestCase):
         # 验证结果
         self.assertFalse(result)
     
-    def test_bucket_exists_error(self):
+    def test_enable_event_notifications(self):
         """
-        测试检查存储桶存在时发生错误的情况
+        测试配置存储桶事件通知
         """
-        # 导入ClientError
-        from botocore.exceptions import ClientError
+        # 设置存储桶现有的通知配置，包含一个SNS目标和同一队列的旧配置
+        topic = {'TopicArn': 'arn:aws:sns:us-east-1:123:topic', 'Events': ['s3:ObjectCreated:*']}
+        self.mock_s3_client.get_bucket_notification_configuration.return_value = {
+            'ResponseMetadata': {},
+            'TopicConfigurations': [topic],
+            'QueueConfigurations': [{'QueueArn': 'arn:aws:sqs:us-east-1:123:queue', 'Events': ['s3:ObjectCreated:*']}]
+        }
         
-        # 设置mock s3客户端的head_bucket方法，抛出非404错误
-        error_response = {'Error': {'Code': '500', 'Message': 'Internal Server Error'}}
-        self.mock_s3_client.head_bucket.side_effect = ClientError(
-            error_response, 'HeadBucket'
-        )
+        # 调用enable_event_notifications方法
+        self.s3_service.enable_event_notifications("test-bucket", "arn:aws:sqs:us-east-1:123:queue")
+        
+        # 验证put_bucket_notification_configuration方法被调用，保留了其他目标并替换了同一队列的配置
+        call = self.mock_s3_client.put_bucket_notification_configuration.call_args
+        self.assertEqual(call.kwargs['Bucket'], "test-bucket")
+        self.assertEqual(call.kwargs['NotificationConfiguration'], {
+            'TopicConfigurations': [topic],
+            'QueueConfigurations': [{
+                'QueueArn': 'arn:aws:sqs:us-east-1:123:queue',
+                'Events': ['s3:ObjectCreated:*', 's3:ObjectRemoved:*']
+            }]
+        })
+    
+    def test_listener_receive_events(self):
+        """
+        测试监听器从SQS消息解析事件
+        """
+        # 设置mock SQS消息，包含一个创建事件和一个删除事件
+        records = [
+            {'eventName': 'ObjectCreated:Put', 'eventTime': '2026-01-01T00:00:00Z',
+             's3': {'bucket': {'name': 'test-bucket'}, 'object': {'key': 'new+file.txt', 'size': 10, 'eTag': 'abc'}}},
+            {'eventName': 'ObjectRemoved:Delete', 'eventTime': '2026-01-01T00:00:01Z',
+             's3': {'bucket': {'name': 'test-bucket'}, 'object': {'key': 'old.txt'}}}
+        ]
+        # 其他存储桶的消息和格式不正确的消息
+        other = [
+            {'eventName': 'ObjectCreated:Put', 'eventTime': '2026-01-01T00:00:02Z',
+             's3': {'bucket': {'name': 'other-bucket'}, 'object': {'key': 'other.txt', 'size': 1, 'eTag': 'def'}}},
+            {'eventName': 'ObjectCreated:Put', 'eventTime': '2026-01-01T00:00:03Z'}
+        ]
+        self.mock_s3_client.receive_message.return_value = {
+            'Messages': [
+                {'Body': json.dumps({'Records': records}), 'ReceiptHandle': 'handle'},
+                {'Body': json.dumps({'Records': other}), 'ReceiptHandle': 'other-handle'},
+                {'Body': 'not json', 'ReceiptHandle': 'bad-handle'}
+            ]
+        }
         
-        # 验证调用_bucket_exists方法会抛出异常
-        with self.assertRaises(Exception) as context:
-            self.s3_service._bucket_exists("test-bucket")
+        # 创建使用SQS的监听器
+        events = []
+        config = BucketListenerConfig()
+        config.sqs_queue_url = "https://sqs.example.com/queue"
+        config.event_handler = events.append
+        listener = BucketListener(self.s3_service, config)
+        listener.last_objects['old.txt'] = {'Key': 'old.txt'}
+        
+        # 接收一次事件
+        listener._receive_events("test-bucket")
+        
+        # 验证事件类型和对象键
+        self.assertEqual(
+            [(e.event_type, e.key) for e in events],
+            [(EventType.OBJECT_CREATED, 'new file.txt'), (EventType.OBJECT_DELETED, 'old.txt')]
+        )
+        # 验证对象列表只包含本存储桶的对象，且记录了与列举结果相同格式的修改时间
+        self.assertEqual(list(listener.last_objects), ['new file.txt'])
+        self.assertEqual(
+            listener.last_objects['new file.txt']['LastModified'], datetime(2026, 1, 1, tzinfo=timezone.utc)
+        )
+        # 验证所有消息都被删除，其他存储桶和格式不正确的消息不会被反复投递
+        entries = self.mock_s3_client.delete_message_batch.call_args.kwargs['Entries']
+        self.assertEqual([entry['ReceiptHandle'] for entry in entries], ['handle', 'other-handle', 'bad-handle'])
+    
+    def test_listener_check_for_changes(self):
+        """
+        测试轮询监听器检测对象的创建、修改和删除
+        """
+        # 设置上一次和本次列举的对象
+        last_modified = datetime(2026, 1, 1)
+        old = lambda key, e_tag: {'Key': key, 'Size': 1, 'LastModified': last_modified, 'ETag': e_tag}
+        self.mock_s3_client.get_paginator.return_value.paginate.return_value = [
+            {'Contents': [old('same.txt', '1'), old('changed.txt', '2'), old('new.txt', '1')]}
+        ]
+        
+        # 创建轮询监听器
+        events = []
+        config = BucketListenerConfig()
+        config.event_handler = events.append
+        listener = BucketListener(self.s3_service, config)
+        listener.last_objects = {
+            'same.txt': old('same.txt', '1'),
+            'changed.txt': old('changed.txt', '1'),
+            'removed.txt': old('removed.txt', '1')
+        }
         
-        # 验证异常消息包含预期内容
-        self.assertIn("Failed to check bucket existence", str(context.exception))
+        # 检查一次变化
+        listener._check_for_changes("test-bucket")
+        
+        # 验证事件类型和对象键
+        self.assertEqual(
+            {e.key: e.event_type for e in events},
+            {
+                'removed.txt': EventType.OBJECT_DELETED,
+                'new.txt': EventType.OBJECT_CREATED,
+                'changed.txt': EventType.OBJECT_MODIFIED
+            }
+        )
+        # 验证对象列表已更新
+        self.assertEqual(set(listener.last_objects), {'same.txt', 'changed.txt', 'new.txt'})
+
+    def test_listener_check_for_changes_failure(self):
+        """
+        测试轮询监听器列举中途失败时不误报删除事件
+        """
+        # 设置分页器在返回第一页后抛出ClientError异常
+        def pages(**kwargs):
+            yield {'Contents': [{'Key': 'a.txt', 'Size': 1, 'LastModified': datetime(2026, 1, 1), 'ETag': '1'}]}
+            raise _CE_500
+        self.mock_s3_client.get_paginator.return_value.paginate.side_effect = pages
+
+        # 创建轮询监听器，已知对象中包含第二页的对象
+        events = []
+        config = BucketListenerConfig()
+        config.event_handler = events.append
+        listener = BucketListener(self.s3_service, config)
+        listener.last_objects = {
+            'a.txt': {'Key': 'a.txt', 'Size': 1, 'LastModified': datetime(2026, 1, 1), 'ETag': '1'},
+            'b.txt': {'Key': 'b.txt', 'Size': 1, 'LastModified': datetime(2026, 1, 1), 'ETag': '1'}
+        }
+
+        # 验证检查变化会抛出异常，且未列举到的对象没有被删除
+        with self.assertRaisesRegex(Exception, r"Failed to list objects"):
+            listener._check_for_changes("test-bucket")
+        self.assertEqual(events, [])
+        self.assertIn('b.txt', listener.last_objects)
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    import pytest
+    raise SystemExit(pytest.main([__file__]))
\ No newline at end of file